@@ -1,6 +1,22 @@
 # -*- mode: python ; coding: utf-8 -*-
 
 
+# Módulos de Qt que la aplicación no usa (solo QtCore, QtGui y QtWidgets), más tkinter:
+# no se empaquetan, así la carpeta pesa menos y el ejecutable arranca antes
+QT_EXCLUDES = [
+    f'PySide6.{module}' for module in (
+        'Qt3DAnimation', 'Qt3DCore', 'Qt3DExtras', 'Qt3DInput', 'Qt3DLogic', 'Qt3DRender',
+        'QtBluetooth', 'QtCharts', 'QtConcurrent', 'QtDataVisualization', 'QtDBus', 'QtDesigner',
+        'QtGraphs', 'QtHelp', 'QtHttpServer', 'QtLocation', 'QtMultimedia', 'QtMultimediaWidgets',
+        'QtNetwork', 'QtNetworkAuth', 'QtNfc', 'QtOpenGL', 'QtOpenGLWidgets', 'QtPdf', 'QtPdfWidgets',
+        'QtPositioning', 'QtPrintSupport', 'QtQml', 'QtQuick', 'QtQuick3D', 'QtQuickControls2',
+        'QtQuickWidgets', 'QtRemoteObjects', 'QtScxml', 'QtSensors', 'QtSerialBus', 'QtSerialPort',
+        'QtSpatialAudio', 'QtSql', 'QtStateMachine', 'QtSvg', 'QtSvgWidgets', 'QtTest', 'QtTextToSpeech',
+        'QtUiTools', 'QtWebChannel', 'QtWebEngineCore', 'QtWebEngineQuick', 'QtWebEngineWidgets',
+        'QtWebSockets', 'QtXml',
+    )
+] + ['tkinter']
+
 a = Analysis(
     ['main.py'],
     pathex=[],
@@ -10,7 +26,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=QT_EXCLUDES,
     noarchive=False,
     optimize=0,
 )
@@ -0,0 +1,285 @@
+# benchmark.py
+"""
+Mediciones de rendimiento de la detección.
+
+Comandos:
+    downscale  Compara velocidad y exhaustividad (recall) de detectar sobre copias
+               reducidas frente a la detección a resolución completa.
+    sweep      Barrido de parámetros de detectMultiScale (scaleFactor, minNeighbors,
+               minSize e hilos) sobre cada cascada e imagen; guarda un JSON o CSV.
+    compare    Compara dos resultados de sweep y señala las regresiones de tiempo.
+
+Uso:
+    python benchmark.py downscale
+    python benchmark.py downscale --source-width 3840 --widths 1920 1280 960 640
+    python benchmark.py sweep -o base.json
+    python benchmark.py sweep --cascades haarcascade_eye.xml --images fotos/ -o nuevo.json
+    python benchmark.py compare base.json nuevo.json
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from batch import collect_images
+from detector import HAARCASCADE_DIR, IMAGES_DIR, MIN_NEIGHBORS, SCALE_FACTOR, detect_scaled, iou_matrix
+
+DEFAULT_CASCADE = 'haarcascade_frontalface_default.xml'
+DEFAULT_WIDTHS = [1920, 1280, 960, 640, 480, 320]
+IOU_THRESHOLD = 0.5 # Una detección coincide con la de referencia si su IoU supera este valor
+
+# Valores por defecto del barrido (sweep)
+SWEEP_SCALE_FACTORS = [SCALE_FACTOR, 1.2, 1.3]
+SWEEP_MIN_NEIGHBORS = [3, MIN_NEIGHBORS]
+SWEEP_MIN_SIZES = [30]
+SWEEP_THREADS = sorted({1, os.cpu_count() or 1})
+SWEEP_KEY = ('cascade', 'image', 'scale_factor', 'min_neighbors', 'min_size', 'threads')
+REGRESSION_TOLERANCE = 0.10 # Más de un 10 % más lento que la referencia cuenta como regresión
+
+
+def load_test_images(sources=None):
+    """Carga las imágenes indicadas (por defecto, las de imgPruebas) como pares (nombre, imagen)."""
+    if not sources:
+        sources = [os.path.join(IMAGES_DIR, f) for f in sorted(os.listdir(IMAGES_DIR))
+                   if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    images = []
+    for path in sources:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Advertencia: no se pudo leer {path}", file=sys.stderr)
+            continue
+        images.append((os.path.basename(path), image))
+    return images
+
+
+def time_median(function, repeat):
+    """Ejecuta `function` `repeat` veces y devuelve (mediana en ms, último resultado)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, result
+
+
+def time_call(function, repeat):
+    """Ejecuta `function` `repeat` veces y devuelve (mejor tiempo en ms, último resultado)."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def match_recall(reference, candidates, threshold=IOU_THRESHOLD):
+    """Fracción de cajas de referencia que tienen alguna coincidencia entre los candidatos."""
+    if len(reference) == 0: return 1.0
+    if len(candidates) == 0: return 0.0
+    return float(np.mean(iou_matrix(reference, candidates).max(axis=1) >= threshold))
+
+
+def bench_downscale(images, classifier, widths, repeat=3):
+    """Mide cada ancho de detección contra la detección a resolución completa."""
+    rows = []
+    for name, image in images:
+        gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        height, width = gray_image.shape
+        full_ms, reference = time_call(lambda: detect_scaled(classifier, gray_image), repeat)
+        rows.append({'image': name, 'size': f"{width}x{height}", 'detection_width': width,
+                     'ms': full_ms, 'speedup': 1.0, 'detections': len(reference), 'recall': 1.0})
+
+        for target in widths:
+            if target >= width: continue
+            ms, detections = time_call(lambda: detect_scaled(classifier, gray_image, target), repeat)
+            rows.append({'image': name, 'size': f"{width}x{height}", 'detection_width': target,
+                         'ms': ms, 'speedup': full_ms / ms if ms > 0 else 0.0,
+                         'detections': len(detections), 'recall': match_recall(reference, detections)})
+    return rows
+
+
+def print_table(rows, columns):
+    """Imprime las filas como una tabla de texto alineada."""
+    formatted = [[f"{row[c]:.2f}" if isinstance(row[c], float) else str(row[c]) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in formatted)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in formatted:
+        print("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+
+
+def bench_sweep(images, cascades, scale_factors, min_neighbors, min_sizes, threads, repeat=3):
+    """Mide cada combinación de parámetros para cada cascada e imagen."""
+    gray_images = [(name, cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)) for name, image in images]
+    previous_threads = cv2.getNumThreads()
+    rows = []
+    try:
+        for cascade_name in cascades:
+            classifier = cv2.CascadeClassifier(os.path.join(HAARCASCADE_DIR, cascade_name))
+            if classifier.empty():
+                print(f"Advertencia: no se pudo cargar {cascade_name}", file=sys.stderr)
+                continue
+            for thread_count, scale, neighbors, size in itertools.product(threads, scale_factors, min_neighbors, min_sizes):
+                cv2.setNumThreads(thread_count)
+                for name, gray_image in gray_images:
+                    ms, detections = time_median(
+                        lambda: detect_scaled(classifier, gray_image, None, scale, neighbors, (size, size)), repeat)
+                    rows.append({'cascade': cascade_name, 'image': name, 'scale_factor': scale,
+                                 'min_neighbors': neighbors, 'min_size': size, 'threads': thread_count,
+                                 'ms': ms, 'detections': len(detections)})
+                    print(f"{cascade_name} {name} sf={scale} mn={neighbors} ms={size} t={thread_count}: "
+                          f"{ms:.1f} ms, {len(detections)} detecciones", file=sys.stderr)
+    finally:
+        cv2.setNumThreads(previous_threads)
+    return rows
+
+
+def environment_info():
+    """Datos del entorno para poder comparar resultados entre versiones y máquinas."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'opencv': cv2.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def write_rows(path, rows, metadata):
+    """Guarda las filas en JSON (con metadatos) o en CSV, según la extensión."""
+    if path.lower().endswith('.csv'):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else list(SWEEP_KEY))
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({**metadata, 'rows': rows}, f, indent=2)
+
+
+def read_rows(path):
+    """Lee las filas de un resultado guardado por write_rows."""
+    if path.lower().endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        for row in rows:
+            row.update(scale_factor=float(row['scale_factor']), min_neighbors=int(row['min_neighbors']),
+                       min_size=int(row['min_size']), threads=int(row['threads']),
+                       ms=float(row['ms']), detections=int(row['detections']))
+        return rows
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['rows']
+
+
+def compare_rows(baseline, current, tolerance=REGRESSION_TOLERANCE):
+    """Empareja las filas por parámetros y calcula la variación de tiempo y de detecciones."""
+    reference = {tuple(row[k] for k in SWEEP_KEY): row for row in baseline}
+    rows = []
+    for row in current:
+        base = reference.get(tuple(row[k] for k in SWEEP_KEY))
+        if base is None: continue
+        ratio = row['ms'] / base['ms'] if base['ms'] > 0 else 1.0
+        rows.append({**{k: row[k] for k in SWEEP_KEY}, 'base_ms': base['ms'], 'ms': row['ms'], 'ratio': ratio,
+                     'detections_delta': row['detections'] - base['detections'],
+                     'regression': 'sí' if ratio > 1 + tolerance else ''})
+    return rows
+
+
+def run_downscale(args):
+    classifier = cv2.CascadeClassifier(os.path.join(HAARCASCADE_DIR, args.cascade))
+    if classifier.empty():
+        print(f"Error: No se pudo cargar el clasificador: {args.cascade}", file=sys.stderr)
+        return 1
+
+    images = load_test_images(args.images)
+    if args.source_width:
+        # Simula entradas de alta resolución ampliando las imágenes de prueba
+        images = [(name, cv2.resize(image, (args.source_width, round(image.shape[0] * args.source_width / image.shape[1])),
+                                    interpolation=cv2.INTER_CUBIC)) for name, image in images]
+
+    rows = bench_downscale(images, classifier, args.widths, args.repeat)
+    print_table(rows, ['image', 'size', 'detection_width', 'ms', 'speedup', 'detections', 'recall'])
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'cascade': args.cascade, 'rows': rows}, f, indent=2)
+    return 0
+
+
+def run_sweep(args):
+    cascades = args.cascades or sorted(f for f in os.listdir(HAARCASCADE_DIR) if f.endswith('.xml'))
+    images = load_test_images()
+    if args.images:
+        images += load_test_images(collect_images(args.images))
+
+    rows = bench_sweep(images, cascades, args.scale_factors, args.min_neighbors, args.min_sizes,
+                       args.threads, args.repeat)
+    write_rows(args.output, rows, environment_info())
+    print(f"{len(rows)} mediciones guardadas en {args.output}", file=sys.stderr)
+    return 0
+
+
+def run_compare(args):
+    rows = compare_rows(read_rows(args.baseline), read_rows(args.current), args.tolerance)
+    if not rows:
+        print("No hay mediciones en común entre los dos archivos.", file=sys.stderr)
+        return 1
+    print_table(rows, list(SWEEP_KEY) + ['base_ms', 'ms', 'ratio', 'detections_delta', 'regression'])
+    regressions = sum(1 for row in rows if row['regression'])
+    print(f"\n{regressions} regresiones de {len(rows)} mediciones (tolerancia {args.tolerance:.0%})")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mediciones de rendimiento de la detección Haar Cascade.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    downscale = commands.add_parser('downscale', help="Velocidad vs. recall de la detección reducida")
+    downscale.add_argument('-c', '--cascade', default=DEFAULT_CASCADE, help="Archivo .xml dentro de haarcascade")
+    downscale.add_argument('-i', '--images', nargs='+', help="Imágenes a usar (por defecto, las de imgPruebas)")
+    downscale.add_argument('--widths', nargs='+', type=int, default=DEFAULT_WIDTHS, help="Anchos de detección a probar")
+    downscale.add_argument('--source-width', type=int, help="Ampliar las imágenes a este ancho antes de medir")
+    downscale.add_argument('--repeat', type=int, default=3, help="Repeticiones por medición (se toma la mejor)")
+    downscale.add_argument('-o', '--output', help="Guardar los resultados en JSON")
+    downscale.set_defaults(run=run_downscale)
+
+    sweep = commands.add_parser('sweep', help="Barrido de parámetros de detectMultiScale")
+    sweep.add_argument('-c', '--cascades', nargs='+', help="Cascadas a medir (por defecto, todas las de haarcascade)")
+    sweep.add_argument('-i', '--images', nargs='+', help="Imágenes, directorios o patrones glob además de imgPruebas")
+    sweep.add_argument('--scale-factors', nargs='+', type=float, default=SWEEP_SCALE_FACTORS)
+    sweep.add_argument('--min-neighbors', nargs='+', type=int, default=SWEEP_MIN_NEIGHBORS)
+    sweep.add_argument('--min-sizes', nargs='+', type=int, default=SWEEP_MIN_SIZES, help="Lado de minSize en píxeles")
+    sweep.add_argument('--threads', nargs='+', type=int, default=SWEEP_THREADS, help="Valores para cv2.setNumThreads")
+    sweep.add_argument('--repeat', type=int, default=3, help="Repeticiones por medición (se toma la mediana)")
+    sweep.add_argument('-o', '--output', default='benchmark.json', help="Archivo de resultados (.json o .csv)")
+    sweep.set_defaults(run=run_sweep)
+
+    compare = commands.add_parser('compare', help="Compara dos resultados de sweep")
+    compare.add_argument('baseline', help="Resultado de referencia")
+    compare.add_argument('current', help="Resultado a comparar")
+    compare.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                         help="Fracción de tiempo extra tolerada antes de contar una regresión")
+    compare.set_defaults(run=run_compare)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
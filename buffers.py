@@ -0,0 +1,142 @@
+# buffers.py
+"""
+Búferes reutilizables por stream para el pipeline de video.
+
+Cada cámara tiene un FramePool: un anillo de fotogramas preasignados sobre los
+que VideoCapture.read(image=...) decodifica directamente, y un búfer de gris fijo
+para cvtColor(dst=...). En régimen no se reserva memoria por fotograma.
+
+La propiedad es explícita: cada fotograma del anillo lleva un contador de
+referencias. La captura lo entrega con una; cada etapa que lo conserva más allá
+de su llamada (grabación, visor, "Guardar Resultado") llama a retain() y después
+a release(). El búfer vuelve al anillo solo cuando el contador llega a cero.
+"""
+import threading
+
+import cv2
+import numpy as np
+
+FRAME_POOL_SIZE = 8 # Fotogramas por stream: colas (2 + 2), detección, render, visor y grabación
+
+
+class FramePool:
+    """
+    Anillo de fotogramas de un stream. Si todos están en uso, read() deja que
+    OpenCV reserve uno nuevo fuera del anillo (se cuenta como desborde) en lugar
+    de bloquear la captura; retain() y release() sobre esos fotogramas no hacen nada.
+    Si la resolución cambia, los búferes viejos se descartan a medida que se liberan.
+    """
+    def __init__(self, size=FRAME_POOL_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._buffers = {} # id(búfer) -> búfer (el anillo los mantiene vivos)
+        self._refs = {} # id(búfer) -> referencias vivas
+        self._sequence = {} # id(búfer) -> número del fotograma que contiene
+        self._free = []
+        self._shape = None
+        self._gray = None
+        self.frames = 0 # Fotogramas leídos
+        self.allocations = 0 # Arreglos reservados (anillo, gris y desbordes)
+        self.allocated_bytes = 0
+        self.overflows = 0 # Lecturas con el anillo agotado
+
+    def read(self, capture):
+        """Lee el siguiente fotograma sobre un búfer libre. Devuelve (ok, fotograma con una referencia)."""
+        buffer = self._acquire()
+        ok, frame = capture.read() if buffer is None else capture.read(image=buffer)
+        if not ok:
+            if buffer is not None:
+                self.release(buffer)
+            return False, None
+        with self._lock:
+            self.frames += 1
+            if frame is not buffer:
+                # Primer fotograma, cambio de resolución o anillo agotado: OpenCV reservó uno nuevo
+                self.allocations += 1
+                self.allocated_bytes += frame.nbytes
+                if buffer is not None:
+                    self._forget(buffer)
+                if frame.shape != self._shape:
+                    self._shape = frame.shape
+                    for stale in self._free:
+                        self._forget(stale)
+                    self._free = []
+                if len(self._buffers) < self.size:
+                    self._adopt(frame)
+            if id(frame) in self._buffers:
+                self._sequence[id(frame)] = self.frames
+        return True, frame
+
+    def gray(self, frame):
+        """
+        Conversión a gris sobre el búfer fijo del stream. El resultado vale hasta la
+        próxima llamada: solo lo usa la detección en curso (una por stream a la vez).
+        """
+        if self._gray is None or self._gray.shape != frame.shape[:2]:
+            self._gray = np.empty(frame.shape[:2], dtype=np.uint8)
+            self.allocations += 1
+            self.allocated_bytes += self._gray.nbytes
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+
+    def sequence(self, frame):
+        """Número del fotograma que contiene el búfer (0 si no es del anillo)."""
+        with self._lock:
+            return self._sequence.get(id(frame), 0)
+
+    def retain(self, frame):
+        """Suma una referencia: el fotograma no se reutiliza hasta el release() correspondiente."""
+        with self._lock:
+            if id(frame) in self._refs:
+                self._refs[id(frame)] += 1
+
+    def release(self, frame):
+        with self._lock:
+            key = id(frame)
+            if key not in self._refs: return
+            self._refs[key] -= 1
+            if self._refs[key] > 0: return
+            if frame.shape == self._shape:
+                self._free.append(frame)
+            else:
+                self._forget(frame)
+
+    def stats(self):
+        with self._lock:
+            in_use = sum(1 for refs in self._refs.values() if refs > 0)
+            pool_bytes = sum(buffer.nbytes for buffer in self._buffers.values())
+            return {
+                'buffers': len(self._buffers),
+                'buffers_in_use': in_use,
+                'buffer_bytes': pool_bytes + (self._gray.nbytes if self._gray is not None else 0),
+                'buffer_frames': self.frames,
+                'buffer_allocations': self.allocations,
+                'buffer_allocated_bytes': self.allocated_bytes,
+                'buffer_overflows': self.overflows,
+            }
+
+    def _acquire(self):
+        with self._lock:
+            if self._free:
+                buffer = self._free.pop()
+            elif self._shape is not None and len(self._buffers) < self.size:
+                buffer = np.empty(self._shape, dtype=np.uint8)
+                self.allocations += 1
+                self.allocated_bytes += buffer.nbytes
+                self._adopt(buffer)
+                return buffer
+            else:
+                if self._shape is not None:
+                    self.overflows += 1
+                return None
+            self._refs[id(buffer)] = 1
+            return buffer
+
+    def _adopt(self, buffer):
+        self._buffers[id(buffer)] = buffer
+        self._refs[id(buffer)] = 1
+
+    def _forget(self, buffer):
+        key = id(buffer)
+        self._buffers.pop(key, None)
+        self._refs.pop(key, None)
+        self._sequence.pop(key, None)
@@ -1,13 +1,18 @@
 # controller.py
 import os
 from datetime import datetime
-import cv2
+from PySide6.QtCore import QTimer
+
+from metrics import STAGE_LABELS
+from detector import default_cascade_set, default_feature_graph
 
 # --- Constantes ---
 # MODIFICADO: Guardar los resultados en una carpeta dentro del directorio del usuario
 # Esto es más limpio y evita problemas de permisos.
 home_dir = os.path.expanduser("~")
 OUTPUT_DIR = os.path.join(home_dir, 'DetectorResultados')
+RECORDINGS_DIR = os.path.join(OUTPUT_DIR, 'grabaciones') # Grabación continua de detecciones
+STATS_INTERVAL_MS = 1000 # Cada cuánto se refrescan los FPS y la latencia de cada cámara
 
 
 class DetectorController:
@@ -18,26 +23,50 @@ class DetectorController:
         self.model = model
         self.view = view
         self._processed_image = None
+        self._processed_stream = None # Cámara de la que viene _processed_image (retenido en su anillo)
+        self._stats_timer = QTimer()
+        self._stats_timer.timeout.connect(self.refresh_stream_stats)
         self._connect_signals()
         
-        # Poblar la UI con datos iniciales del modelo
+        # Poblar la UI con datos iniciales del modelo. Las cámaras salen de la última
+        # búsqueda guardada y se actualizan cuando termina la búsqueda en segundo plano.
         self.view.populate_combos(
             self.model.get_available_cascades(),
             self.model.get_available_images(),
-            cameras=self.model.get_available_cameras()
+            cameras=self.model.get_cached_cameras()
         )
+        if self.view.camera_combo.currentData() is None:
+            self.view.set_cameras([], searching=True)
+        self.model.discover_cameras_async()
 
     def _connect_signals(self):
         """Conecta las señales de la Vista y el Modelo a los slots del Controlador."""
         # Señales de la Vista -> Slots del Controlador
         self.view.analyze_button_clicked.connect(self.analyze_image)
         self.view.camera_button_clicked.connect(self.toggle_camera)
+        self.view.add_camera_button_clicked.connect(self.add_camera)
         self.view.save_button_clicked.connect(self.save_result)
         self.view.classifier_changed.connect(self.classifier_changed)
+        self.view.stream_cascade_changed.connect(self.stream_cascade_changed)
+        self.view.detection_width_changed.connect(self.model.set_detection_width)
+        self.view.detect_every_changed.connect(self.model.set_detect_every)
+        self.view.motion_gate_toggled.connect(self.model.set_motion_gate)
+        self.view.quality_target_changed.connect(self.model.set_quality_target)
+        self.view.hierarchy_toggled.connect(self.hierarchy_toggled)
+        self.view.multi_cascade_toggled.connect(self.multi_cascade_toggled)
+        self.view.performance_overlay_toggled.connect(self.performance_overlay_toggled)
+        self.view.recording_toggled.connect(self.recording_toggled)
         
         # Señales del Modelo -> Slots del Controlador
         self.model.frame_updated.connect(self.on_frame_updated)
+        self.model.stream_frame_updated.connect(self.on_stream_frame_updated)
         self.model.detection_completed.connect(self.on_detection_completed)
+        self.model.stream_stopped.connect(self.on_stream_stopped)
+        self.model.camera_found.connect(self.view.add_camera_option)
+        self.model.camera_discovery_finished.connect(self.on_camera_discovery_finished)
+        self.model.classifier_loaded.connect(self.on_classifier_loaded)
+        self.model.stream_cascade_loaded.connect(self.on_stream_cascade_loaded)
+        self.model.image_saved.connect(self.on_image_saved)
 
     # --- Slots para señales de la Vista ---
     def analyze_image(self):
@@ -52,43 +81,94 @@ class DetectorController:
         self.model.process_static_image(image_name)
 
     def toggle_camera(self):
-        """Inicia o detiene la cámara."""
+        """Inicia la cámara seleccionada o detiene todas las cámaras activas."""
         if not self.model.is_camera_active:
-            cascade_name = self.view.cascade_combo.currentText()
-            # Obtiene el índice de la cámara seleccionada del menú
-            camera_index = self.view.camera_combo.currentData()
-            
-            if camera_index is None:
-                self.view.show_message("Error", "No hay cámaras disponibles.", "critical")
-                return
+            self.add_camera()
+        else:
+            self.model.stop_camera()
+            self._on_streams_changed()
 
-            if self.model.load_classifier(cascade_name):
-                # Pasa el índice de la cámara al modelo
-                if self.model.start_camera(camera_index):
-                    self.view.set_camera_button_state(True)
-                    self.view.set_image_mode_enabled(False)
-                else:
-                    self.view.show_message("Error", f"No se pudo acceder a la Cámara {camera_index}.", "critical")
+    def add_camera(self):
+        """Agrega la cámara seleccionada a las cámaras activas."""
+        cascade_name = self.view.cascade_combo.currentText()
+        # Obtiene el índice de la cámara seleccionada del menú
+        camera_index = self.view.camera_combo.currentData()
+        
+        if camera_index is None:
+            self.view.show_message("Error", "No hay cámaras disponibles.", "critical")
+            return
+        if camera_index in self.model.sessions:
+            self.view.show_message("Aviso", f"La Cámara {camera_index} ya está activa.", "warning")
+            return
+
+        if self.model.load_classifier(cascade_name):
+            # Pasa el índice de la cámara al modelo
+            if self.model.start_camera(camera_index):
+                self._on_streams_changed()
             else:
-                self.view.show_message("Error", "Seleccione un clasificador válido primero.", "warning")
+                self.view.show_message("Error", f"No se pudo acceder a la Cámara {camera_index}.", "critical")
         else:
-            self.model.stop_camera()
-            self.view.set_camera_button_state(False)
-            self.view.set_image_mode_enabled(True)
+            self.view.show_message("Error", "Seleccione un clasificador válido primero.", "warning")
+
+    def _on_streams_changed(self):
+        """Sincroniza la cuadrícula y los botones con las cámaras activas del modelo."""
+        active = self.model.is_camera_active
+        sessions = dict(self.model.sessions)
+        self.view.set_stream_tiles(sorted(sessions), {index: session.cascade_name for index, session in sessions.items()})
+        self.view.set_camera_button_state(active)
+        self.view.set_image_mode_enabled(not active)
+        self._update_stats_timer()
+
+    def _update_stats_timer(self):
+        """Las estadísticas se refrescan mientras haya cámaras activas o la superposición esté visible."""
+        if self.model.is_camera_active or self.view.performance_check.isChecked():
+            if not self._stats_timer.isActive():
+                self._stats_timer.start(STATS_INTERVAL_MS)
+        else:
+            self._stats_timer.stop()
 
     def classifier_changed(self, cascade_name):
-        """Recarga el clasificador si la cámara está activa."""
-        if self.model.is_camera_active:
-            print(f"Cambiando clasificador en vivo a: {cascade_name}")
-            if not self.model.load_classifier(cascade_name):
-                self.view.show_message("Error", f"No se pudo cargar: {cascade_name}", "critical")
-                self.toggle_camera() # Detener cámara si el clasificador es inválido
+        """Carga en segundo plano la cascada por defecto (imágenes y cámaras nuevas)."""
+        self.model.load_classifier_async(cascade_name)
+
+    def stream_cascade_changed(self, stream_id, cascade_name):
+        """Carga en segundo plano la cascada de una sola cámara, elegida en su recuadro."""
+        self.model.set_stream_cascade(stream_id, cascade_name)
+
+    def hierarchy_toggled(self, enabled):
+        """Activa o desactiva la búsqueda de ojos y sonrisas dentro de cada detección."""
+        self.model.set_cascade_graph(default_feature_graph() if enabled else None)
+
+    def multi_cascade_toggled(self, enabled):
+        """Activa o desactiva la búsqueda de rostros de frente y de perfil en una sola pasada."""
+        if not self.model.set_cascade_set(default_cascade_set() if enabled else None):
+            self.view.show_message("Error", "No se pudieron cargar las cascadas de rostro y perfil.", "critical")
+            self.view.multi_cascade_check.setChecked(False)
+
+    def performance_overlay_toggled(self, enabled):
+        """Muestra u oculta los FPS y la latencia por etapa sobre el visor."""
+        self.view.set_performance_overlay_visible(enabled)
+        self._update_stats_timer()
+        if enabled:
+            self.refresh_stream_stats()
+
+    def recording_toggled(self, enabled):
+        """Activa o desactiva la grabación continua de los fotogramas con detecciones."""
+        if enabled:
+            try:
+                self.model.start_recording(RECORDINGS_DIR)
+            except OSError as e:
+                self.view.show_message("Error", f"No se pudo iniciar la grabación:\n{e}", "critical")
+                self.view.recording_check.setChecked(False)
+                return
+            print(f"Grabando detecciones en: {RECORDINGS_DIR}")
+        else:
+            self.model.stop_recording()
 
     def save_result(self):
-        """Guarda la última imagen procesada."""
+        """Guarda la última imagen procesada (la escritura corre en segundo plano)."""
         if self._processed_image is None: return
 
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
         date_str = datetime.now().strftime('%d%m%y_%H%M%S')
         base_img, _ = os.path.splitext(self.view.image_combo.currentText())
         base_cas, _ = os.path.splitext(self.view.cascade_combo.currentText())
@@ -97,20 +177,101 @@ class DetectorController:
         path = os.path.join(OUTPUT_DIR, filename)
         
         # OpenCV guarda en BGR, y nuestra imagen está en ese formato.
-        try:
-            cv2.imwrite(path, self._processed_image)
-            self.view.show_message("Éxito", f"Imagen guardada en:\n{path}")
-        except Exception as e:
-            self.view.show_message("Error al guardar", f"No se pudo guardar la imagen:\n{e}", "critical")
+        self.model.save_image_async(self._processed_image, path, self._processed_stream)
 
 
     # --- Slots para señales del Modelo ---
     def on_frame_updated(self, frame):
         """Actualiza la imagen en la vista cuando el modelo emite un nuevo frame."""
-        self._processed_image = frame
+        self._set_processed_image(frame)
         self.view.display_image(frame)
 
+    def on_image_saved(self, path, error):
+        """Se activa cuando termina de escribirse la imagen de 'Guardar Resultado'."""
+        if error:
+            self.view.show_message("Error al guardar", f"No se pudo guardar la imagen:\n{error}", "critical")
+        else:
+            self.view.show_message("Éxito", f"Imagen guardada en:\n{path}")
+
     def on_detection_completed(self, num_detections):
         """Se activa después del análisis de una imagen estática."""
         print(f"Análisis completado. Detecciones: {num_detections}")
         self.view.set_save_button_enabled(True)
+
+    def on_classifier_loaded(self, cascade_name, success):
+        """Se activa cuando termina la carga en segundo plano de un clasificador."""
+        # Las cámaras activas siguen con su propia cascada: no hace falta detenerlas
+        if not success and self.model.is_camera_active:
+            self.view.show_message("Error", f"No se pudo cargar: {cascade_name}", "critical")
+
+    def on_stream_cascade_loaded(self, stream_id, cascade_name, success):
+        """Se activa cuando termina la carga de la cascada de una cámara."""
+        if success:
+            print(f"Cámara {stream_id}: clasificador cambiado a {cascade_name}")
+            return
+        self.view.show_message("Error", f"No se pudo cargar: {cascade_name}", "critical")
+        session = self.model.sessions.get(stream_id)
+        if session is not None:
+            self.view.set_stream_cascade(stream_id, session.cascade_name)
+
+    def on_stream_frame_updated(self, stream_id, frame, sequence):
+        """Muestra el fotograma procesado de una cámara en su recuadro."""
+        self.view.display_stream_image(stream_id, frame, sequence)
+        # Queda retenido como último resultado ("Guardar Resultado") hasta que llegue otro
+        self._set_processed_image(frame, stream_id)
+
+    def _set_processed_image(self, image, stream_id=None):
+        """Reemplaza el último resultado; si el anterior era de una cámara, vuelve a su anillo."""
+        if self._processed_stream is not None:
+            self.model.release_frame(self._processed_stream, self._processed_image)
+        self._processed_image = image
+        self._processed_stream = stream_id
+
+    def on_stream_stopped(self, stream_id):
+        """Una cámara dejó de entregar fotogramas: libera sus recursos y actualiza la UI."""
+        if stream_id not in self.model.sessions: return
+        self.model.stop_camera(stream_id)
+        self._on_streams_changed()
+
+    def on_camera_discovery_finished(self, cameras):
+        """Deja en el menú solo las cámaras que respondieron (más las que ya están en uso)."""
+        self.view.set_cameras(sorted(set(cameras) | set(self.model.sessions)))
+
+    def refresh_stream_stats(self):
+        """Muestra los FPS, la latencia y el costo de render de cada cámara bajo su recuadro."""
+        render_ms = self.view.render_stats()['avg_ms']
+        pipeline_stats = self.model.get_pipeline_stats()
+        for stream_id, stats in pipeline_stats['streams'].items():
+            caption = (f"Cámara {stream_id} · {stats['fps']:.1f} FPS · {stats['latency_ms']:.0f} ms"
+                       f" · render {render_ms:.1f} ms")
+            if self.model.motion_gate_enabled and stats.get('motion_frames'):
+                skipped = stats['motion_skipped_frames'] / stats['motion_frames']
+                caption += f" · sin movimiento {skipped:.0%} ({stats['motion_skipped_pixels']:.0%} px)"
+            if stats.get('quality_enabled'):
+                caption += f" · nivel de calidad {stats['quality_level']}/{stats['quality_max_level']}"
+            self.view.set_stream_caption(stream_id, caption)
+        if self.view.performance_check.isChecked():
+            self.view.set_performance_overlay(self._format_performance(pipeline_stats))
+
+    def _format_performance(self, pipeline_stats):
+        """Texto de la superposición: FPS total y p50/p99 de cada etapa."""
+        fps = sum(stats['fps'] for stats in pipeline_stats['streams'].values())
+        lines = [f"{fps:.1f} FPS · {pipeline_stats['dropped']} descartados", "etapa           p50     p99 (ms)"]
+        for stage, stats in pipeline_stats['stages'].items():
+            lines.append(f"{STAGE_LABELS.get(stage, stage):<14}{stats['p50_ms']:6.1f}  {stats['p99_ms']:6.1f}")
+        for stream_id, stats in pipeline_stats['streams'].items():
+            if not stats.get('quality_enabled'): continue
+            width = f"{stats['quality_detection_width']} px" if stats['quality_detection_width'] else "completa"
+            cost = stats['quality_cost_ms']
+            lines.append(f"cámara {stream_id}: nivel {stats['quality_level']} · {width} · sf {stats['quality_scale_factor']}"
+                         f" · cada {stats['quality_detect_every']} · "
+                         + (f"{cost:.1f}/{stats['quality_budget_ms']:.0f} ms" if cost is not None else "midiendo"))
+        streams = pipeline_stats['streams'].values()
+        if streams:
+            memory = sum(stats['buffer_bytes'] for stats in streams)
+            lines.append(f"búferes {memory / 1e6:.1f} MB · reservas {sum(stats['buffer_allocations'] for stats in streams)}"
+                         f" · desbordes {sum(stats['buffer_overflows'] for stats in streams)}")
+        recorder = pipeline_stats['recorder']
+        if recorder is not None:
+            lines.append(f"grabadas {recorder['saved']} · en cola {recorder['pending']} · descartadas {recorder['dropped']}")
+        return '\n'.join(lines)
@@ -0,0 +1,816 @@
+# detector.py
+"""
+Núcleo de detección, sin dependencias de Qt.
+
+Clasificadores, cachés, detección simple, jerárquica y de varias cascadas, y el
+dibujo de las cajas. Lo usan la aplicación (model.py, que le suma las señales y
+las cámaras) y los scripts sin interfaz (batch, video, benchmark, server), que así
+se importan sin cargar PySide6.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import cv2
+import numpy as np
+
+from metrics import StageMetrics
+from recorder import boxes_to_json
+
+
+# --- Resolución dinámica de rutas para PyInstaller (Solución Universal) ---
+if getattr(sys, 'frozen', False):
+    # Si la aplicación está "congelada" por PyInstaller
+    if hasattr(sys, '_MEIPASS'):
+        # Modo --onefile: los datos están en una carpeta temporal
+        base_path = sys._MEIPASS
+    else:
+        # Modo de carpeta: los datos están junto al ejecutable
+        base_path = os.path.dirname(sys.executable)
+else:
+    # Si se ejecuta como un script normal .py
+    base_path = os.path.dirname(os.path.abspath(__file__))
+
+
+# --- Constantes con rutas dinámicas ---
+HAARCASCADE_DIR = os.path.join(base_path, 'haarcascade')
+IMAGES_DIR = os.path.join(base_path, 'imgPruebas')
+
+# --- Parámetros de detección (detectMultiScale) ---
+SCALE_FACTOR = 1.1
+MIN_NEIGHBORS = 5
+MIN_SIZE = (30, 30)
+# Ancho máximo de la imagen sobre la que corre la detección (None = resolución completa).
+# Con entradas HD/4K, detectar sobre una copia reducida evita recorrer niveles de la pirámide
+# que solo encuentran objetos diminutos.
+DETECTION_WIDTH = None
+
+# Número de clasificadores que se mantienen cargados en memoria
+CLASSIFIER_CACHE_SIZE = 4
+# Imágenes estáticas ya decodificadas y resultados de detección que se conservan en memoria
+IMAGE_CACHE_SIZE = 8
+IMAGE_CACHE_MAX_BYTES = 128 * 1024 * 1024 # Tope de memoria de las imágenes decodificadas (una de 16 MP ocupa ~48 MB)
+DETECTION_CACHE_SIZE = 64
+# Carpeta donde persistir los resultados de detección entre ejecuciones (None = solo en memoria)
+DETECTION_CACHE_DIR = os.environ.get('DETECTOR_DETECTION_CACHE_DIR') or None
+
+# --- Colores de dibujo (BGR) ---
+BOX_COLOR = (0, 255, 125)
+# Colores de los hijos en la detección jerárquica (uno por cada cascada hija)
+CHILD_BOX_COLORS = [(255, 100, 100), (0, 165, 255), (255, 0, 255)]
+# Colores por clase en el modo de varias cascadas
+CLASS_BOX_COLORS = {'rostro': BOX_COLOR, 'perfil': (255, 160, 0), 'torso': (0, 200, 255)}
+
+# --- Modo de varias cascadas ---
+NMS_IOU_THRESHOLD = 0.3 # Solapamiento a partir del cual dos cajas (de cualquier cascada) se consideran la misma
+MULTI_CASCADE_WORKERS = 4 # Cascadas que corren a la vez sobre el mismo búfer
+
+# --- Detección por teselas (imágenes muy grandes) ---
+TILE_SIZE = 2048 # Lado del núcleo de cada tesela, en píxeles de la imagen de detección
+TILE_OBJECT_WINDOWS = 8 # Objetos de hasta N ventanas del clasificador se buscan en las teselas; los mayores, en una copia reducida
+TILE_SIZE_OVERLAP = 1.5 # Los dos niveles comparten esta banda de tamaños para no perder objetos en el límite
+TILE_WORKERS = os.cpu_count() or 1 # Teselas que se procesan a la vez (OpenCV libera el GIL)
+TILED_MIN_PIXELS = 4 * TILE_SIZE * TILE_SIZE # En modo automático, imágenes estáticas a partir de este tamaño (~16 MP)
+
+
+def detect_scaled(classifier, gray_image, detection_width=None, scale_factor=SCALE_FACTOR,
+                  min_neighbors=MIN_NEIGHBORS, min_size=MIN_SIZE, max_size=None):
+    """
+    Ejecuta detectMultiScale sobre una copia reducida a `detection_width` de ancho
+    y devuelve las cajas en coordenadas de la imagen original.
+    `min_size` y `max_size` se expresan en píxeles de la imagen original.
+    """
+    gray_image, scale = scale_for_detection(gray_image, detection_width)
+    return detect_prescaled(classifier, gray_image, scale, scale_factor, min_neighbors, min_size, max_size)
+
+
+def scale_for_detection(gray_image, detection_width=None):
+    """Copia reducida a `detection_width` de ancho (o la misma imagen si ya es menor) y la escala aplicada."""
+    height, width = gray_image.shape[:2]
+    if not detection_width or width <= detection_width:
+        return gray_image, 1.0
+    scale = detection_width / width
+    return cv2.resize(gray_image, (detection_width, max(1, round(height * scale))),
+                      interpolation=cv2.INTER_AREA), scale
+
+
+def detect_prescaled(classifier, gray_image, scale, scale_factor=SCALE_FACTOR, min_neighbors=MIN_NEIGHBORS,
+                     min_size=MIN_SIZE, max_size=None, with_scores=False):
+    """
+    detectMultiScale sobre una imagen ya reducida por `scale`; devuelve las cajas en
+    coordenadas de la imagen original. Con `with_scores` devuelve también, por caja,
+    el número de detecciones vecinas que la respaldan (detectMultiScale2).
+    """
+    # Por debajo de la ventana del clasificador no tiene sentido buscar
+    window_w, window_h = classifier.getOriginalWindowSize()
+    options = {'minSize': (max(window_w, round(min_size[0] * scale)), max(window_h, round(min_size[1] * scale)))}
+    if max_size:
+        options['maxSize'] = (round(max_size[0] * scale), round(max_size[1] * scale))
+
+    if with_scores:
+        detections, scores = classifier.detectMultiScale2(gray_image, scale_factor, min_neighbors, **options)
+    else:
+        detections = classifier.detectMultiScale(gray_image, scale_factor, min_neighbors, **options)
+    if len(detections) == 0:
+        detections, scores = np.empty((0, 4), dtype=np.int32), np.empty(0, dtype=np.int32)
+    else:
+        detections = np.asarray(detections, dtype=np.int32)
+        if scale != 1.0:
+            detections = np.round(detections / scale).astype(np.int32)
+    if with_scores:
+        return detections, np.asarray(scores, dtype=np.int32).reshape(-1)
+    return detections
+
+
+def detect_tiled(classifier_cache, cascade_path, gray_image, executor, detection_width=None,
+                 scale_factor=SCALE_FACTOR, min_neighbors=MIN_NEIGHBORS, min_size=MIN_SIZE, max_size=None,
+                 tile_size=TILE_SIZE):
+    """
+    Detección por teselas para imágenes muy grandes; devuelve las mismas cajas que
+    detect_scaled (dentro de una tolerancia) repartiendo el trabajo en `executor`.
+    Cada tesela es un núcleo de `tile_size` más un margen del tamaño máximo de objeto
+    que se busca en ella (TILE_OBJECT_WINDOWS ventanas del clasificador); una caja
+    solo cuenta en la tesela que contiene su centro, así ningún objeto se parte ni
+    se repite. Los objetos mayores se buscan, con el mismo esquema, en una copia
+    reducida. Las teselas son vistas de la imagen: la memoria extra es la de los
+    búferes de detección de las teselas en curso, no la de la imagen completa.
+    """
+    with classifier_cache.borrow(cascade_path) as classifier:
+        if classifier is None: return np.empty((0, 4), dtype=np.int32)
+        window = max(classifier.getOriginalWindowSize())
+    image, scale = scale_for_detection(gray_image, detection_width)
+    jobs = _submit_tiles(classifier_cache, cascade_path, image, scale, executor, window, scale_factor,
+                         min_neighbors, min_size, max_size, tile_size)
+    boxes, scores = [], []
+    for job in jobs:
+        job_boxes, job_scores = job.result()
+        boxes.extend(job_boxes)
+        scores.extend(job_scores)
+    # Un objeto cerca del tamaño límite puede aparecer en dos niveles
+    keep = non_max_suppression(boxes, scores)
+    return np.array([boxes[i] for i in keep], dtype=np.int32).reshape(-1, 4)
+
+
+def _submit_tiles(classifier_cache, cascade_path, image, scale, executor, window, scale_factor,
+                  min_neighbors, min_size, max_size, tile_size):
+    """Encola las teselas de un nivel (y, recursivamente, las de los niveles reducidos)."""
+    height, width = image.shape[:2]
+    margin = TILE_OBJECT_WINDOWS * window # Objeto más grande (px de `image`) que se busca en las teselas
+    if width <= tile_size + 2 * margin and height <= tile_size + 2 * margin:
+        # Cabe en una tesela: una sola pasada con todos los tamaños
+        return [executor.submit(_detect_tile, classifier_cache, cascade_path, image, scale, (0, 0, width, height),
+                                scale_factor, min_neighbors, min_size, max_size)]
+
+    tile_max = margin / scale # El mismo límite, en píxeles de la imagen original
+    jobs = []
+    if max_size is None or max_size[0] > tile_max or max_size[1] > tile_max:
+        # Objetos mayores que el margen: en una copia reducida un número entero de pasos
+        # de scaleFactor, así su pirámide coincide con la de una pasada completa
+        steps = max(1, round(np.log(TILE_OBJECT_WINDOWS / 2) / np.log(scale_factor)))
+        factor = scale_factor ** -steps
+        reduced = cv2.resize(image, (max(1, round(width * factor)), max(1, round(height * factor))),
+                             interpolation=cv2.INTER_AREA)
+        reduced_min = int(tile_max / TILE_SIZE_OVERLAP)
+        jobs += _submit_tiles(classifier_cache, cascade_path, reduced, scale * factor, executor, window,
+                              scale_factor, min_neighbors, (max(min_size[0], reduced_min), max(min_size[1], reduced_min)),
+                              max_size, tile_size)
+    if min_size[0] > tile_max or min_size[1] > tile_max:
+        return jobs
+
+    # Con el margen igual al tamaño límite, un objeto de hasta el doble sigue entero dentro de su tesela
+    tile_max_size = (int(tile_max * TILE_SIZE_OVERLAP),) * 2
+    if max_size is not None:
+        tile_max_size = (min(tile_max_size[0], max_size[0]), min(tile_max_size[1], max_size[1]))
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            core = (x, y, min(tile_size, width - x), min(tile_size, height - y))
+            jobs.append(executor.submit(_detect_tile, classifier_cache, cascade_path, image, scale, core,
+                                        scale_factor, min_neighbors, min_size, tile_max_size, margin))
+    return jobs
+
+
+def _detect_tile(classifier_cache, cascade_path, image, scale, core, scale_factor, min_neighbors,
+                 min_size, max_size, margin=0):
+    """Detecta en el núcleo `core` (x, y, w, h) ampliado con `margin`; cajas y vecinos en coordenadas originales."""
+    x, y, w, h = core
+    height, width = image.shape[:2]
+    x0, y0 = max(0, x - margin), max(0, y - margin)
+    x1, y1 = min(width, x + w + margin), min(height, y + h + margin)
+    with classifier_cache.borrow(cascade_path) as classifier:
+        if classifier is None: return [], []
+        # Rebanada de NumPy: una vista sobre el mismo búfer, sin copiar píxeles
+        boxes, scores = detect_prescaled(classifier, image[y0:y1, x0:x1], scale, scale_factor, min_neighbors,
+                                         min_size, max_size, with_scores=True)
+    kept_boxes, kept_scores = [], []
+    for (bx, by, bw, bh), score in zip(boxes, scores):
+        bx, by = bx + round(x0 / scale), by + round(y0 / scale)
+        # Solo cuenta en la tesela que contiene su centro
+        center_x, center_y = (bx + bw / 2) * scale, (by + bh / 2) * scale
+        if x <= center_x < x + w and y <= center_y < y + h:
+            kept_boxes.append((bx, by, bw, bh))
+            kept_scores.append(int(score))
+    return kept_boxes, kept_scores
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Matriz de intersección sobre unión entre dos conjuntos de cajas (x, y, w, h)."""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    inter_w = np.clip(np.minimum(ax2[:, None], bx2[None, :]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(ay2[:, None], by2[None, :]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    intersection = inter_w * inter_h
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def non_max_suppression(boxes, scores, iou_threshold=NMS_IOU_THRESHOLD):
+    """
+    Supresión de no máximos voraz: recorre las cajas de mayor a menor puntaje y
+    descarta las que se solapan con una ya elegida. Devuelve los índices conservados.
+    """
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    if len(boxes) == 0: return []
+    overlaps = iou_matrix(boxes, boxes)
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    keep = []
+    for i in np.argsort(-np.asarray(scores), kind='stable'):
+        if suppressed[i]: continue
+        keep.append(int(i))
+        suppressed |= overlaps[i] > iou_threshold
+    return keep
+
+
+class CascadeNode:
+    """
+    Nodo del grafo de detección jerárquica.
+    Las cajas de un nodo se usan como regiones de interés de sus hijos, que solo
+    buscan dentro de ellas. `region` limita la búsqueda a una parte de la caja padre,
+    en fracciones (x, y, ancho, alto): por ejemplo, los ojos en la mitad superior.
+    Si `cascade_name` es None, el nodo usa el clasificador seleccionado en el modelo.
+    """
+    def __init__(self, cascade_name=None, label=None, children=(), region=(0.0, 0.0, 1.0, 1.0),
+                 scale_factor=SCALE_FACTOR, min_neighbors=MIN_NEIGHBORS, min_size=MIN_SIZE):
+        self.cascade_name = cascade_name
+        self.label = label or (os.path.splitext(cascade_name)[0] if cascade_name else 'objeto')
+        self.children = list(children)
+        self.region = tuple(region)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = tuple(min_size)
+
+    @classmethod
+    def from_dict(cls, config):
+        """Construye el grafo desde un diccionario (por ejemplo, cargado de un JSON)."""
+        children = [cls.from_dict(child) for child in config.get('children', [])]
+        options = {k: config[k] for k in ('label', 'region', 'scale_factor', 'min_neighbors', 'min_size') if k in config}
+        return cls(config.get('cascade'), children=children, **options)
+
+    def to_dict(self):
+        """Inverso de from_dict; también sirve para identificar el grafo en la caché de detecciones."""
+        return {
+            'cascade': self.cascade_name,
+            'label': self.label,
+            'region': list(self.region),
+            'scale_factor': self.scale_factor,
+            'min_neighbors': self.min_neighbors,
+            'min_size': list(self.min_size),
+            'children': [child.to_dict() for child in self.children],
+        }
+
+
+def default_feature_graph():
+    """Grafo por defecto: el clasificador seleccionado y, dentro de cada caja, ojos y sonrisas."""
+    return CascadeNode(label='objeto', children=[
+        CascadeNode('haarcascade_eye.xml', 'ojo', region=(0.0, 0.0, 1.0, 0.6), min_size=(15, 15)),
+        CascadeNode('haarcascade_smile.xml', 'sonrisa', region=(0.0, 0.5, 1.0, 0.5),
+                    scale_factor=1.7, min_neighbors=20, min_size=(20, 20)),
+    ])
+
+
+class CascadeSpec:
+    """
+    Una cascada del modo de varias cascadas: la clase con la que se etiquetan sus
+    cajas, si corre sobre la imagen espejada (p. ej. el perfil del otro lado) y
+    sus parámetros de detectMultiScale.
+    """
+    def __init__(self, cascade_name, label=None, mirrored=False, scale_factor=SCALE_FACTOR,
+                 min_neighbors=MIN_NEIGHBORS, min_size=MIN_SIZE):
+        self.cascade_name = cascade_name
+        self.label = label or os.path.splitext(cascade_name)[0]
+        self.mirrored = mirrored
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = tuple(min_size)
+
+    def to_dict(self):
+        return {
+            'cascade': self.cascade_name,
+            'label': self.label,
+            'mirrored': self.mirrored,
+            'scale_factor': self.scale_factor,
+            'min_neighbors': self.min_neighbors,
+            'min_size': list(self.min_size),
+        }
+
+
+def default_cascade_set():
+    """Rostros de frente y de perfil hacia ambos lados (la cascada de perfil solo ve uno)."""
+    return [
+        CascadeSpec('haarcascade_frontalface_default.xml', 'rostro'),
+        CascadeSpec('haarcascade_profileface.xml', 'perfil'),
+        CascadeSpec('haarcascade_profileface.xml', 'perfil', mirrored=True),
+    ]
+
+
+class ClassifierCache:
+    """
+    Caché LRU de clasificadores Haar Cascade indexada por ruta.
+    Evita volver a interpretar el XML en cada uso y se invalida sola
+    cuando cambia la fecha de modificación del archivo.
+
+    Un CascadeClassifier no admite detecciones simultáneas desde varios hilos,
+    así que la caché guarda instancias libres por ruta: borrow() presta una
+    (o carga otra si todas están en uso) y la devuelve al terminar.
+    """
+    def __init__(self, max_size=CLASSIFIER_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict() # ruta -> [mtime, instancias libres]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @contextmanager
+    def borrow(self, cascade_path):
+        """Presta un clasificador de uso exclusivo (None si no se puede cargar)."""
+        classifier, mtime = self._acquire(cascade_path)
+        try:
+            yield classifier
+        finally:
+            if classifier is not None:
+                self._release(cascade_path, mtime, classifier)
+
+    def load(self, cascade_path):
+        """Carga el clasificador en la caché si hace falta. Devuelve si es válido."""
+        with self.borrow(cascade_path) as classifier:
+            return classifier is not None
+
+    def preload(self, cascade_path, instances=1):
+        """
+        Deja `instances` clasificadores listos para la ruta, para que los primeros
+        usos concurrentes no tengan que interpretar el XML. Devuelve si es válido.
+        """
+        borrowed = []
+        try:
+            for _ in range(instances):
+                classifier, mtime = self._acquire(cascade_path)
+                if classifier is None: return False
+                borrowed.append((classifier, mtime))
+            return True
+        finally:
+            for classifier, mtime in borrowed:
+                self._release(cascade_path, mtime, classifier)
+
+    def _acquire(self, cascade_path):
+        try:
+            mtime = os.path.getmtime(cascade_path)
+        except OSError:
+            return None, None
+
+        with self._lock:
+            entry = self._entries.get(cascade_path)
+            if entry is not None and entry[0] == mtime:
+                self._entries.move_to_end(cascade_path)
+                if entry[1]:
+                    self.hits += 1
+                    return entry[1].pop(), mtime
+            self.misses += 1
+
+        # El XML se interpreta fuera del candado: puede tardar y no debe bloquear los aciertos
+        classifier = cv2.CascadeClassifier(cascade_path)
+        if classifier.empty(): return None, mtime
+        return classifier, mtime
+
+    def _release(self, cascade_path, mtime, classifier):
+        with self._lock:
+            entry = self._entries.get(cascade_path)
+            if entry is None or entry[0] < mtime:
+                entry = self._entries[cascade_path] = [mtime, []]
+            elif entry[0] != mtime:
+                return # El archivo cambió mientras estaba prestado: se descarta
+            entry[1].append(classifier)
+            self._entries.move_to_end(cascade_path)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Devuelve tamaño, aciertos, fallos y desalojos de la caché."""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'instances': sum(len(entry[1]) for entry in self._entries.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class ImageCache:
+    """
+    Caché LRU de imágenes decodificadas, indexada por ruta y validada con la fecha
+    de modificación y el tamaño del archivo. Junto a cada imagen guarda el hash de
+    su contenido. Las imágenes devueltas no deben modificarse: se dibuja sobre copias.
+    El límite es doble: como mucho max_size imágenes y max_bytes en total; una imagen
+    que por sí sola supera max_bytes no se conserva.
+    """
+    def __init__(self, max_size=IMAGE_CACHE_SIZE, max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # ruta -> ((mtime, tamaño), imagen, hash)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, image_path):
+        """Devuelve (imagen BGR, hash del contenido) o (None, None) si no se puede leer."""
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None, None
+        version = (stat.st_mtime, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(image_path)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(image_path)
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+
+        try:
+            with open(image_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None, None
+        # imdecode sobre los bytes ya leídos: un solo acceso al disco para el hash y la imagen
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None: return None, None
+        content_hash = hashlib.blake2b(data, digest_size=16).hexdigest()
+        with self._lock:
+            old = self._entries.pop(image_path, None)
+            if old is not None:
+                self._bytes -= old[1].nbytes
+            if image.nbytes <= self.max_bytes:
+                self._entries[image_path] = (version, image, content_hash)
+                self._bytes += image.nbytes
+            while len(self._entries) > self.max_size or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[1].nbytes
+        return image, content_hash
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+class DetectionCache:
+    """
+    Caché LRU de resultados de detección crudos (sin dibujar), indexada por una clave
+    que combina el hash de la imagen, la cascada y los parámetros de detección.
+    Si se indica `disk_dir`, los resultados también se guardan como JSON y
+    sobreviven entre ejecuciones.
+    """
+    def __init__(self, max_size=DETECTION_CACHE_SIZE, disk_dir=None):
+        self.max_size = max_size
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict() # clave -> detecciones
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(content_hash, **params):
+        """Clave estable a partir del hash de la imagen y de los parámetros (serializables en JSON)."""
+        description = json.dumps({'image': content_hash, **params}, sort_keys=True)
+        return hashlib.blake2b(description.encode('utf-8'), digest_size=16).hexdigest()
+
+    def get(self, key):
+        """Devuelve las detecciones guardadas o None."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        detections = self._read_disk(key)
+        with self._lock:
+            if detections is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, detections)
+        return detections
+
+    def put(self, key, detections):
+        with self._lock:
+            self._store(key, detections)
+        self._write_disk(key, detections)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+    def _store(self, key, detections):
+        self._entries[key] = detections
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key):
+        if not self.disk_dir: return None
+        try:
+            with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                boxes = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Las detecciones planas vuelven a ser un arreglo (N, 4); las anidadas quedan como dicts
+        if all(isinstance(box, list) for box in boxes):
+            return np.array(boxes, dtype=np.int32).reshape(-1, 4)
+        return boxes
+
+    def _write_disk(self, key, detections):
+        if not self.disk_dir: return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            with open(self._disk_path(key), 'w', encoding='utf-8') as f:
+                json.dump(boxes_to_json(detections), f)
+        except OSError as e:
+            print(f"Advertencia: no se pudo guardar el resultado en caché: {e}")
+
+
+class Detector:
+    """
+    Estado y lógica de detección compartidos por la aplicación y los scripts sin
+    interfaz: cascada seleccionada, parámetros, modos jerárquico y de varias
+    cascadas, y las cachés de clasificadores, imágenes y resultados.
+    """
+    def __init__(self, classifier_cache_size=CLASSIFIER_CACHE_SIZE, detection_cache_dir=DETECTION_CACHE_DIR):
+        self.cascade_name = None # Cascada seleccionada (imágenes estáticas y cámaras nuevas)
+        self.detection_width = DETECTION_WIDTH
+        self.cascade_graph = None # Grafo de detección jerárquica (None = un solo clasificador)
+        self.cascade_set = None # Lista de CascadeSpec del modo de varias cascadas (None = apagado)
+        self.tiled_detection = None # Teselas en imágenes estáticas: True, False o None (según el tamaño)
+        self._cascade_pool = ThreadPoolExecutor(max_workers=MULTI_CASCADE_WORKERS, thread_name_prefix="cascada")
+        self._tile_pool = ThreadPoolExecutor(max_workers=TILE_WORKERS, thread_name_prefix="tesela")
+        self.classifier_cache = ClassifierCache(classifier_cache_size)
+        # Análisis de imágenes estáticas: imágenes decodificadas y detecciones reutilizables
+        self.image_cache = ImageCache()
+        self.detection_cache = DetectionCache(disk_dir=detection_cache_dir)
+        self.metrics = StageMetrics() # Latencia por etapa (la vista registra la conversión y el pintado)
+
+    def get_available_cascades(self):
+        """Devuelve una lista de archivos .xml en el directorio de cascadas."""
+        try:
+            return [f for f in os.listdir(HAARCASCADE_DIR) if f.endswith('.xml')]
+        except FileNotFoundError:
+            # Añadimos un print para depuración
+            print(f"Error: No se encontró el directorio de cascadas en: {HAARCASCADE_DIR}")
+            return []
+
+    def get_available_images(self):
+        """Devuelve una lista de imágenes en el directorio de pruebas."""
+        try:
+            return [f for f in os.listdir(IMAGES_DIR) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+        except FileNotFoundError:
+            # Añadimos un print para depuración
+            print(f"Error: No se encontró el directorio de imágenes en: {IMAGES_DIR}")
+            return []
+
+    def load_classifier(self, cascade_name):
+        """Carga un clasificador Haar Cascade (desde la caché si ya se usó antes)."""
+        if not cascade_name: return False
+        if not self.classifier_cache.load(os.path.join(HAARCASCADE_DIR, cascade_name)): return False
+        self.cascade_name = cascade_name
+        return True
+
+    def set_detection_width(self, width):
+        """Fija el ancho de detección (None o 0 para usar la resolución completa)."""
+        self.detection_width = width or None
+
+    def set_tiled_detection(self, mode):
+        """
+        Detección por teselas en imágenes estáticas (ver detect_tiled): True siempre,
+        False nunca, None a partir de TILED_MIN_PIXELS. Solo se aplica con una cascada
+        (sin grafo jerárquico ni modo de varias cascadas).
+        """
+        self.tiled_detection = mode
+
+    def set_cascade_graph(self, graph):
+        """Activa la detección jerárquica con el grafo dado (None para desactivarla)."""
+        self.cascade_graph = graph
+
+    def set_cascade_set(self, cascade_set):
+        """
+        Activa el modo de varias cascadas (lista de CascadeSpec, None para desactivarlo).
+        Mientras está activo, reemplaza a la cascada seleccionada y al grafo jerárquico.
+        """
+        cascade_set = list(cascade_set) if cascade_set else None
+        for spec in cascade_set or []:
+            if not self.classifier_cache.load(os.path.join(HAARCASCADE_DIR, spec.cascade_name)):
+                print(f"Error: no se pudo cargar la cascada {spec.cascade_name}")
+                return False
+        self.cascade_set = cascade_set
+        return True
+
+    def detect_multi(self, gray_image, cascade_set, detection_width=None):
+        """
+        Corre varias cascadas sobre una sola imagen en gris y fusiona sus cajas.
+        La reducción y la ecualización del histograma se hacen una vez y el búfer
+        resultante (y su espejo, si alguna cascada lo pide) se comparte entre todas;
+        cada cascada corre en su propio hilo. Las cajas de todas las clases pasan por
+        una misma supresión de no máximos, así un rostro visto por dos cascadas se
+        queda con la etiqueta de la que tiene más respaldo. Devuelve
+        [{'label': ..., 'box': (x, y, w, h), 'score': vecinos, 'children': {}}, ...]
+        `detection_width` reemplaza al ancho de detección del modelo.
+        """
+        small, scale = scale_for_detection(gray_image, detection_width or self.detection_width)
+        small = cv2.equalizeHist(small)
+        mirrored = cv2.flip(small, 1) if any(spec.mirrored for spec in cascade_set) else None
+        futures = [self._cascade_pool.submit(self._detect_spec, mirrored if spec.mirrored else small, scale, spec)
+                   for spec in cascade_set]
+
+        boxes, scores, labels = [], [], []
+        for spec, future in zip(cascade_set, futures):
+            spec_boxes, spec_scores = future.result()
+            if spec.mirrored and len(spec_boxes):
+                # Volver a las coordenadas de la imagen sin espejar
+                spec_boxes[:, 0] = gray_image.shape[1] - spec_boxes[:, 0] - spec_boxes[:, 2]
+            boxes.extend(spec_boxes)
+            scores.extend(spec_scores)
+            labels.extend([spec.label] * len(spec_boxes))
+
+        keep = non_max_suppression(boxes, scores)
+        return [{'label': labels[i], 'box': tuple(int(v) for v in boxes[i]), 'score': int(scores[i]), 'children': {}}
+                for i in keep]
+
+    def _detect_spec(self, small_image, scale, spec):
+        """Una cascada del modo de varias cascadas (en un hilo de _cascade_pool)."""
+        with self.classifier_cache.borrow(os.path.join(HAARCASCADE_DIR, spec.cascade_name)) as classifier:
+            if classifier is None:
+                return np.empty((0, 4), dtype=np.int32), np.empty(0, dtype=np.int32)
+            return detect_prescaled(classifier, small_image, scale, spec.scale_factor, spec.min_neighbors,
+                                    spec.min_size, with_scores=True)
+
+    def detect_hierarchy(self, image, graph):
+        """
+        Ejecuta el grafo de cascadas sobre una imagen BGR y devuelve la estructura anidada:
+        [{'label': ..., 'box': (x, y, w, h), 'children': {etiqueta_hijo: [...]}}, ...]
+        Las cajas de todos los niveles están en coordenadas de la imagen completa.
+        """
+        gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return self._detect_node(gray_image, graph, self.cascade_name, (0, 0), self.detection_width)
+
+    def _detect_node(self, gray_roi, node, default_cascade, offset, detection_width=None):
+        cascade_name = node.cascade_name or default_cascade
+        if not cascade_name: return []
+        with self.classifier_cache.borrow(os.path.join(HAARCASCADE_DIR, cascade_name)) as classifier:
+            if classifier is None: return []
+            boxes = detect_scaled(classifier, gray_roi, detection_width, node.scale_factor,
+                                  node.min_neighbors, node.min_size)
+        results = []
+        for x, y, w, h in boxes:
+            children = {}
+            for child in node.children:
+                rx, ry, rw, rh = child.region
+                x0, y0 = x + int(w * rx), y + int(h * ry)
+                x1, y1 = x0 + int(w * rw), y0 + int(h * rh)
+                # Rebanada de NumPy: una vista sobre el mismo búfer, sin copiar píxeles
+                child_roi = gray_roi[y0:y1, x0:x1]
+                children[child.label] = self._detect_node(child_roi, child, default_cascade,
+                                                          (offset[0] + x0, offset[1] + y0))
+            results.append({
+                'label': node.label,
+                'box': (int(x) + offset[0], int(y) + offset[1], int(w), int(h)),
+                'children': children,
+            })
+        return results
+
+    def analyze_image(self, image_name):
+        """
+        Procesa una imagen estática y devuelve (imagen anotada, detecciones), o None
+        si no hay cascada o la imagen no se pudo leer. Repetir el análisis de la
+        misma imagen con la misma configuración solo vuelve a dibujar las cajas.
+        """
+        if self.cascade_name is None or not image_name: return None
+
+        image_path = os.path.join(IMAGES_DIR, image_name)
+        image, content_hash = self.image_cache.load(image_path)
+        if image is None: return None
+
+        tiled = self.tiled_detection
+        if tiled is None:
+            tiled = image.shape[0] * image.shape[1] >= TILED_MIN_PIXELS
+        key = self._detection_key(content_hash, tiled)
+        detections = self.detection_cache.get(key)
+        if detections is None:
+            detections = self._detect(image, tiled=tiled)
+            self.detection_cache.put(key, detections)
+
+        # La imagen de la caché queda intacta: se dibuja sobre una copia
+        processed_image = image.copy()
+        with self.metrics.time('draw'):
+            self._draw_detections(processed_image, detections)
+        return processed_image, detections
+
+    def _detection_key(self, content_hash, tiled=False):
+        """Clave de la caché de detecciones: imagen, cascada (y su versión) y parámetros."""
+        cascade_path = os.path.join(HAARCASCADE_DIR, self.cascade_name)
+        try:
+            cascade_mtime = os.path.getmtime(cascade_path)
+        except OSError:
+            cascade_mtime = None
+        return DetectionCache.make_key(
+            content_hash,
+            cascade=self.cascade_name,
+            cascade_mtime=cascade_mtime,
+            detection_width=self.detection_width,
+            scale_factor=SCALE_FACTOR,
+            min_neighbors=MIN_NEIGHBORS,
+            min_size=list(MIN_SIZE),
+            graph=self.cascade_graph.to_dict() if self.cascade_graph is not None else None,
+            cascade_set=[spec.to_dict() for spec in self.cascade_set] if self.cascade_set is not None else None,
+            tiled=tiled,
+        )
+
+    def _detect(self, image, cascade_name=None, detection_width=None, tiled=False, gray_image=None):
+        """
+        Ejecuta el clasificador sobre la imagen y devuelve los rectángulos
+        (o la estructura anidada de detect_hierarchy si hay un grafo activo, o las
+        cajas etiquetadas de detect_multi en el modo de varias cascadas).
+        Con `tiled`, una sola cascada se ejecuta por teselas (detect_tiled).
+        `gray_image` es la imagen ya convertida a gris, si quien llama la tiene.
+        """
+        cascade_name = cascade_name or self.cascade_name
+        detection_width = detection_width or self.detection_width
+        cascade_set = self.cascade_set
+        if gray_image is None:
+            with self.metrics.time('gray'):
+                gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        with self.metrics.time('detect'):
+            if cascade_set is not None:
+                return self.detect_multi(gray_image, cascade_set, detection_width)
+            if self.cascade_graph is not None:
+                return self._detect_node(gray_image, self.cascade_graph, cascade_name, (0, 0), detection_width)
+            if tiled:
+                return detect_tiled(self.classifier_cache, os.path.join(HAARCASCADE_DIR, cascade_name), gray_image,
+                                    self._tile_pool, detection_width)
+            return self._detect_gray(gray_image, cascade_name, detection_width)
+
+    def _region_width(self, gray_region, frame_width, detection_width=None):
+        """Ancho de detección de una región, reducida en la misma proporción que el fotograma completo."""
+        detection_width = detection_width or self.detection_width
+        if not detection_width: return None
+        return max(1, round(gray_region.shape[1] * detection_width / frame_width))
+
+    def _detect_gray(self, gray_image, cascade_name, detection_width=None, scale_factor=SCALE_FACTOR):
+        """Una cascada sobre una imagen en gris; `detection_width` reemplaza al ancho de detección del modelo."""
+        with self.classifier_cache.borrow(os.path.join(HAARCASCADE_DIR, cascade_name)) as classifier:
+            if classifier is None: return np.empty((0, 4), dtype=np.int32)
+            return detect_scaled(classifier, gray_image, detection_width or self.detection_width, scale_factor)
+
+    def _draw_detections(self, image, detections, color=BOX_COLOR):
+        """Dibuja los rectángulos de detección (planos o anidados) sobre la imagen."""
+        for detection in detections:
+            box_color = color
+            if isinstance(detection, dict):
+                x, y, w, h = detection['box']
+                for i, children in enumerate(detection['children'].values()):
+                    self._draw_detections(image, children, CHILD_BOX_COLORS[i % len(CHILD_BOX_COLORS)])
+                if 'score' in detection:
+                    # Modo de varias cascadas: color y etiqueta por clase
+                    box_color = CLASS_BOX_COLORS.get(detection['label'], color)
+                    cv2.putText(image, f"{detection['label']} {detection['score']}", (x, max(12, y - 5)),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, box_color, 1, cv2.LINE_AA)
+            else:
+                x, y, w, h = detection
+            cv2.rectangle(image, (x, y), (x + w, y + h), box_color, 2)
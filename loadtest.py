@@ -0,0 +1,123 @@
+# loadtest.py
+"""
+Prueba de carga del servicio de detección (server.py).
+
+Abre varias conexiones persistentes en paralelo, envía imágenes durante un tiempo
+fijo y reporta el rendimiento (peticiones/s) y la latencia de cola (p50/p95/p99/máx),
+además de cuántas peticiones fueron rechazadas con 503.
+
+Uso:
+    python server.py -c haarcascade_frontalface_default.xml &
+    python loadtest.py imgPruebas --clients 16 --duration 20
+"""
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlparse
+
+from batch import collect_images, percentile
+from detector import IMAGES_DIR
+
+
+def run_client(url, bodies, deadline, results, query):
+    """Un cliente: una conexión keep-alive que envía imágenes en ronda hasta el plazo."""
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+    path = '/detect' + (f'?{query}' if query else '')
+    latencies, statuses, errors = [], {}, 0
+    i = 0
+    while time.perf_counter() < deadline:
+        body = bodies[i % len(bodies)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            connection.request('POST', path, body, {'Content-Type': 'application/octet-stream'})
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close() # Se reconecta en la siguiente petición
+            continue
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        if response.status == 200:
+            latencies.append(time.perf_counter() - start)
+        elif response.status == 503:
+            time.sleep(0.01) # Contrapresión: esperar un poco antes de reintentar
+    connection.close()
+    results.append((latencies, statuses, errors))
+
+
+def run_load(url, sources, clients=8, duration=10.0, cascade=None, detection_width=None):
+    """Ejecuta la prueba y devuelve las estadísticas agregadas."""
+    paths = collect_images(sources)
+    if not paths:
+        raise ValueError("No se encontraron imágenes")
+    bodies = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            bodies.append(f.read())
+    query = urlencode({k: v for k, v in (('cascade', cascade), ('detection_width', detection_width)) if v})
+
+    url = urlparse(url)
+    results = []
+    start = time.perf_counter()
+    deadline = start + duration
+    threads = [threading.Thread(target=run_client, args=(url, bodies, deadline, results, query))
+               for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency * 1000 for client_latencies, _, _ in results for latency in client_latencies]
+    statuses = {}
+    for _, client_statuses, _ in results:
+        for status, count in client_statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    return {
+        'clients': clients,
+        'elapsed_s': elapsed,
+        'ok': len(latencies),
+        'rejected': statuses.get(503, 0),
+        'errors': sum(errors for _, _, errors in results) + sum(c for s, c in statuses.items() if s not in (200, 503)),
+        'requests_per_sec': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': max(latencies) if latencies else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga del servicio de detección.")
+    parser.add_argument('sources', nargs='*', default=[IMAGES_DIR], help="Imágenes a enviar (por defecto, imgPruebas)")
+    parser.add_argument('--url', default='http://127.0.0.1:8080', help="Dirección del servicio")
+    parser.add_argument('--clients', type=int, default=8, help="Conexiones concurrentes")
+    parser.add_argument('--duration', type=float, default=10.0, help="Duración de la prueba en segundos")
+    parser.add_argument('-c', '--cascade', help="Cascada a usar (por defecto, la del servicio)")
+    parser.add_argument('--detection-width', type=int, help="Detectar sobre una copia reducida a este ancho")
+    parser.add_argument('--json', action='store_true', help="Imprimir el resultado como JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        stats = run_load(args.url, args.sources, args.clients, args.duration, args.cascade, args.detection_width)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps(stats))
+        return 0
+    print(f"Clientes: {stats['clients']}, duración: {stats['elapsed_s']:.1f} s")
+    print(f"Respuestas correctas: {stats['ok']} ({stats['requests_per_sec']:.1f} peticiones/s), "
+          f"rechazadas (503): {stats['rejected']}, errores: {stats['errors']}")
+    print(f"Latencia: p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms, "
+          f"p99 {stats['p99_ms']:.1f} ms, máx {stats['max_ms']:.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,20 +1,57 @@
 # main.py
+import os
 import sys
+import time
+
+STARTED_AT = time.perf_counter() # Referencia para medir el tiempo hasta la primera ventana
+
+# Solo Qt y la vista antes de mostrar la ventana: OpenCV, NumPy y el modelo se cargan después
+from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import QApplication
 from view import DetectorView
-from model import DetectionModel
-from controller import DetectorController
+
+
+def report_startup(stage):
+    """Imprime el tiempo desde el arranque si se pide (DETECTOR_STARTUP_TIMING=1)."""
+    if os.environ.get('DETECTOR_STARTUP_TIMING'):
+        print(f"Arranque: {stage} en {(time.perf_counter() - STARTED_AT) * 1000:.0f} ms", file=sys.stderr)
+
+
+def load_application(app, view):
+    """Crea el modelo y el controlador con la ventana ya visible; devuelve el controlador."""
+    from model import DetectionModel
+    from controller import DetectorController
+
+    model = DetectionModel()
+    view.set_metrics(model.metrics)
+    controller = DetectorController(model=model, view=view)
+    app.aboutToQuit.connect(model.shutdown) # Termina las escrituras pendientes antes de salir
+
+    # Exportar métricas en un puerto local si se pide (DETECTOR_METRICS_PORT=9100)
+    metrics_port = os.environ.get('DETECTOR_METRICS_PORT')
+    if metrics_port:
+        from metrics import MetricsServer
+        MetricsServer(model.get_pipeline_stats, int(metrics_port)).start()
+
+    view.setEnabled(True)
+    report_startup("aplicación lista")
+    return controller
+
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
-    
-    # 1. Crear las instancias
-    model = DetectionModel()
+
+    # 1. Mostrar la vista cuanto antes, deshabilitada hasta que el modelo esté listo
     view = DetectorView()
-    
-    # 2. Conectarlos a través del Controlador
-    controller = DetectorController(model=model, view=view)
-    
-    # 3. Mostrar la vista y ejecutar la aplicación
+    view.setEnabled(False)
     view.show()
-    sys.exit(app.exec())
\ No newline at end of file
+
+    # 2. Con la ventana ya pintada, crear el modelo y conectarlo a través del Controlador
+    loaded = []
+    def start():
+        report_startup("ventana visible")
+        loaded.append(load_application(app, view))
+    QTimer.singleShot(0, start)
+
+    # 3. Ejecutar la aplicación
+    sys.exit(app.exec())
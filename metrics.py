@@ -0,0 +1,178 @@
+# metrics.py
+"""
+Métricas de latencia por etapa del pipeline y exportación para monitoreo.
+
+Cada etapa (captura, filtro de movimiento, conversión a gris, detección, dibujo,
+conversión a Qt y pintado) registra su duración en un histograma deslizante, del que se obtienen
+p50/p99. MetricsServer las publica en un puerto local como JSON (/stats.json)
+o en el formato de texto de Prometheus (/metrics).
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Etapas en el orden en que recorre un fotograma, con su nombre para mostrar
+STAGES = ('capture', 'motion', 'gray', 'detect', 'draw', 'convert', 'paint')
+STAGE_LABELS = {
+    'capture': 'captura',
+    'motion': 'movimiento',
+    'gray': 'gris',
+    'detect': 'detección',
+    'draw': 'dibujo',
+    'convert': 'conversión Qt',
+    'paint': 'pintado',
+}
+HISTOGRAM_WINDOW = 512 # Muestras recientes por etapa
+METRICS_HOST = '127.0.0.1' # Solo local: las métricas no se exponen a la red
+
+
+class LatencyHistogram:
+    """Duraciones recientes de una etapa (ventana deslizante) más totales acumulados."""
+    def __init__(self, window=HISTOGRAM_WINDOW):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def snapshot(self):
+        samples = sorted(self._samples)
+        def percentile(pct):
+            return samples[min(len(samples) - 1, int(len(samples) * pct))] * 1000 if samples else 0.0
+        return {
+            'count': self.count,
+            'sum_s': self.total,
+            'p50_ms': percentile(0.50),
+            'p99_ms': percentile(0.99),
+            'max_ms': samples[-1] * 1000 if samples else 0.0,
+        }
+
+
+class StageMetrics:
+    """Registro de histogramas por etapa, seguro para usar desde varios hilos."""
+    def __init__(self, window=HISTOGRAM_WINDOW):
+        self.window = window
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram(self.window)
+            histogram.record(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """Mide el bloque y lo registra en la etapa indicada."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def snapshot(self):
+        """Estadísticas por etapa, en el orden de STAGES (las etapas sin muestras se omiten)."""
+        with self._lock:
+            snapshots = {stage: histogram.snapshot() for stage, histogram in self._histograms.items()}
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        return dict(sorted(snapshots.items(), key=lambda item: order.get(item[0], len(order))))
+
+
+def format_prometheus(stats):
+    """
+    Convierte las estadísticas de DetectionModel.get_pipeline_stats() al formato
+    de texto de Prometheus.
+    """
+    lines = [
+        '# HELP detector_stage_seconds Duración de cada etapa del pipeline.',
+        '# TYPE detector_stage_seconds summary',
+    ]
+    for stage, values in stats.get('stages', {}).items():
+        lines.append(f'detector_stage_seconds{{stage="{stage}",quantile="0.5"}} {values["p50_ms"] / 1000:.6f}')
+        lines.append(f'detector_stage_seconds{{stage="{stage}",quantile="0.99"}} {values["p99_ms"] / 1000:.6f}')
+        lines.append(f'detector_stage_seconds_sum{{stage="{stage}"}} {values["sum_s"]:.6f}')
+        lines.append(f'detector_stage_seconds_count{{stage="{stage}"}} {values["count"]}')
+
+    streams = stats.get('streams', {})
+    gauges = (
+        ('detector_stream_fps', 'fps', 'Fotogramas por segundo entregados a la UI.'),
+        ('detector_stream_latency_seconds', 'latency_ms', 'Latencia mediana de captura a render.'),
+        ('detector_stream_dropped_frames_total', 'dropped', 'Fotogramas descartados por colas llenas.'),
+        ('detector_stream_buffer_bytes', 'buffer_bytes', 'Memoria de los búferes reutilizables de fotogramas.'),
+        ('detector_stream_buffer_allocations_total', 'buffer_allocations',
+         'Arreglos reservados para fotogramas (anillo, gris y desbordes).'),
+    )
+    counters = ('dropped', 'buffer_allocations')
+    for name, key, help_text in gauges:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {"counter" if key in counters else "gauge"}')
+        for stream_id, values in streams.items():
+            value = values[key] / 1000 if key == 'latency_ms' else values[key]
+            lines.append(f'{name}{{stream="{stream_id}"}} {value}')
+
+    quality = {stream_id: values for stream_id, values in streams.items() if values.get('quality_enabled')}
+    if quality:
+        lines.append('# HELP detector_stream_quality_level Nivel del control adaptativo de calidad (0 = máxima).')
+        lines.append('# TYPE detector_stream_quality_level gauge')
+        for stream_id, values in quality.items():
+            lines.append(f'detector_stream_quality_level{{stream="{stream_id}"}} {values["quality_level"]}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """
+    Servidor HTTP local con las métricas. `provider` es una función sin argumentos
+    que devuelve el diccionario de estadísticas (normalmente model.get_pipeline_stats).
+    """
+    def __init__(self, provider, port, host=METRICS_HOST):
+        self.provider = provider
+        self.address = (host, port)
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        provider = self.provider
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path in ('/metrics', '/'):
+                    body = format_prometheus(provider()).encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/stats.json':
+                    body = json.dumps(provider()).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Sin una línea en consola por cada consulta
+
+        self._server = ThreadingHTTPServer(self.address, Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metricas", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is None: return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
@@ -1,139 +1,447 @@
 # model.py
+import json
 import os
 import sys 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import cv2
 import numpy as np
-from PySide6.QtCore import QObject, Signal, QTimer
+from PySide6.QtCore import QObject, Signal
 
-# --- Resolución dinámica de rutas para PyInstaller (Solución Universal) ---
-if getattr(sys, 'frozen', False):
-    # Si la aplicación está "congelada" por PyInstaller
-    if hasattr(sys, '_MEIPASS'):
-        # Modo --onefile: los datos están en una carpeta temporal
-        base_path = sys._MEIPASS
-    else:
-        # Modo de carpeta: los datos están junto al ejecutable
-        base_path = os.path.dirname(sys.executable)
-else:
-    # Si se ejecuta como un script normal .py
-    base_path = os.path.dirname(os.path.abspath(__file__))
+# El núcleo de detección no depende de Qt; se reexporta aquí para el código que ya lo importaba de model
+from detector import (
+    BOX_COLOR, CHILD_BOX_COLORS, CLASS_BOX_COLORS, CLASSIFIER_CACHE_SIZE, DETECTION_CACHE_DIR,
+    DETECTION_WIDTH, HAARCASCADE_DIR, IMAGES_DIR, MIN_NEIGHBORS, MIN_SIZE, SCALE_FACTOR,
+    CascadeNode, CascadeSpec, ClassifierCache, DetectionCache, Detector, ImageCache,
+    default_cascade_set, default_feature_graph, detect_prescaled, detect_scaled, iou_matrix,
+    non_max_suppression, scale_for_detection,
+)
+from motion import MotionGate
+from pipeline import CameraSession, DetectionScheduler
+from quality import QualityController
+from recorder import DetectionRecorder
+from tracking import BoxTracker, DETECT_EVERY
 
+# --- Pipeline de video ---
+# Colas pequeñas: si la detección se atrasa se descartan los fotogramas viejos
+# en lugar de acumular latencia.
+CAPTURE_QUEUE_SIZE = 2
+RENDER_QUEUE_SIZE = 2
+QUEUE_TIMEOUT = 0.1 # Segundos que espera cada etapa antes de revisar si debe parar
+DETECTION_WORKERS = os.cpu_count() or 1 # Hilos del pool de detección compartido por las cámaras
 
-# --- Constantes con rutas dinámicas ---
-HAARCASCADE_DIR = os.path.join(base_path, 'haarcascade')
-IMAGES_DIR = os.path.join(base_path, 'imgPruebas')
+# --- Cámaras ---
+MAX_CAMERAS = 10 # Un límite razonable para no escanear infinitamente
+# Backends de captura por nombre; DETECTOR_CAPTURE_BACKEND permite forzar uno (p. ej. "v4l2")
+CAPTURE_BACKENDS = {
+    'any': cv2.CAP_ANY,
+    'msmf': cv2.CAP_MSMF,
+    'dshow': cv2.CAP_DSHOW,
+    'v4l2': cv2.CAP_V4L2,
+    'avfoundation': cv2.CAP_AVFOUNDATION,
+}
+# Última lista de cámaras encontradas, para mostrarla al instante en el siguiente arranque
+CAMERA_CACHE_FILE = os.path.join(os.path.expanduser("~"), '.detector_haar', 'camaras.json')
 
 
-class DetectionModel(QObject):
+def default_capture_backend():
+    """Nombre del backend de captura: el de la variable de entorno o el nativo de la plataforma."""
+    backend = os.environ.get('DETECTOR_CAPTURE_BACKEND', '').lower()
+    if backend in CAPTURE_BACKENDS: return backend
+    if sys.platform.startswith('win'): return 'msmf'
+    if sys.platform.startswith('linux'): return 'v4l2'
+    if sys.platform == 'darwin': return 'avfoundation'
+    return 'any'
+
+
+class DetectionModel(QObject, Detector):
     """
     Modelo: Maneja toda la lógica de OpenCV y el estado de la aplicación.
-    No conoce la existencia de la interfaz gráfica.
+    No conoce la existencia de la interfaz gráfica. La detección viene de
+    Detector (sin Qt); aquí se suman las señales, las cámaras y la grabación.
     """
     # Señales para notificar al Controlador sobre los cambios
     frame_updated = Signal(np.ndarray)
     detection_completed = Signal(int) # Emite el número de detecciones
+    # Fotograma procesado de una cámara (índice, imagen, número de fotograma). La imagen es un
+    # búfer del anillo de la cámara retenido para la UI: se devuelve con release_frame()
+    stream_frame_updated = Signal(int, np.ndarray, int)
+    stream_stopped = Signal(int) # Una cámara dejó de entregar fotogramas
+    camera_found = Signal(int) # La búsqueda en segundo plano encontró una cámara
+    camera_discovery_finished = Signal(list) # Lista final de cámaras encontradas
+    classifier_loaded = Signal(str, bool) # Nombre de la cascada y si se pudo cargar
+    stream_cascade_loaded = Signal(int, str, bool) # Cámara, cascada y si se pudo cargar
+    image_saved = Signal(str, str) # Ruta y mensaje de error ('' si se guardó bien)
 
-    def __init__(self):
-        super().__init__()
-        self.classifier = None
-        self.video_capture = None
-        self.is_camera_active = False
+    def __init__(self, classifier_cache_size=CLASSIFIER_CACHE_SIZE, detection_workers=DETECTION_WORKERS,
+                 capture_backend=None, detection_cache_dir=DETECTION_CACHE_DIR):
+        QObject.__init__(self)
+        Detector.__init__(self, classifier_cache_size, detection_cache_dir)
+        self.capture_backend = capture_backend or default_capture_backend()
+        self.detect_every = DETECT_EVERY
+        self.motion_gate_enabled = False # Detectar solo cuando hay movimiento (cámaras)
+        self.motion_thresholds = {} # Umbrales de MotionGate que reemplazan los de motion.py
+        self.quality_target = (None, None) # (FPS objetivo, latencia de detección en ms) del control adaptativo
+        # Un solo hilo de carga: las peticiones se atienden en orden y gana la última
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="carga-cascada")
+        self._load_generation = 0
+        self._stream_load_generation = {} # cámara -> última petición de set_stream_cascade()
 
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self._update_frame)
+        # Pipeline por cámara: captura -> detección -> render. La captura y el render
+        # tienen hilos propios por cámara; la detección usa un pool compartido.
+        # Las señales se emiten desde hilos de trabajo y Qt las entrega en el hilo de la UI.
+        self.scheduler = DetectionScheduler(detection_workers, QUEUE_TIMEOUT)
+        self.sessions = {} # índice de cámara -> CameraSession
+        self.recorder = None # Grabación continua de detecciones (None = apagada)
+        self._image_writer = None # Escritura en segundo plano de "Guardar Resultado"
+
+    @property
+    def is_camera_active(self):
+        return bool(self.sessions)
 
     def get_available_cameras(self):
         """
         Escanea los índices de las cámaras para encontrar las que están conectadas.
-        Devuelve una lista de índices válidos.
-        """
-        camera_indexes = []
-        # Un límite razonable para no escanear infinitamente
-        for i in range(10): 
-            cap = cv2.VideoCapture(i, cv2.CAP_MSMF)
-            if cap.isOpened():
-                camera_indexes.append(i)
-                cap.release()
-        return camera_indexes
-
-    def get_available_cascades(self):
-        """Devuelve una lista de archivos .xml en el directorio de cascadas."""
+        Los índices se prueban en paralelo. Devuelve una lista de índices válidos.
+        """
+        with ThreadPoolExecutor(max_workers=MAX_CAMERAS, thread_name_prefix="sondeo-camara") as executor:
+            found = [i for i, is_open in zip(range(MAX_CAMERAS), executor.map(self._probe_camera, range(MAX_CAMERAS)))
+                     if is_open]
+        self._save_camera_cache(found)
+        return found
+
+    def discover_cameras_async(self):
+        """
+        Busca cámaras en segundo plano sin bloquear la UI. Emite camera_found por cada
+        cámara que responde y camera_discovery_finished con la lista completa al terminar.
+        """
+        threading.Thread(target=self._discover_cameras, name="busqueda-camaras", daemon=True).start()
+
+    def _discover_cameras(self):
+        found = []
+        with ThreadPoolExecutor(max_workers=MAX_CAMERAS, thread_name_prefix="sondeo-camara") as executor:
+            futures = {executor.submit(self._probe_camera, i): i for i in range(MAX_CAMERAS)}
+            for future in as_completed(futures):
+                if future.result():
+                    found.append(futures[future])
+                    self.camera_found.emit(futures[future])
+        found.sort()
+        self._save_camera_cache(found)
+        self.camera_discovery_finished.emit(found)
+
+    def _probe_camera(self, index):
+        cap = cv2.VideoCapture(index, CAPTURE_BACKENDS[self.capture_backend])
         try:
-            return [f for f in os.listdir(HAARCASCADE_DIR) if f.endswith('.xml')]
-        except FileNotFoundError:
-            # Añadimos un print para depuración
-            print(f"Error: No se encontró el directorio de cascadas en: {HAARCASCADE_DIR}")
-            return []
+            return cap.isOpened()
+        finally:
+            cap.release()
 
-    def get_available_images(self):
-        """Devuelve una lista de imágenes en el directorio de pruebas."""
+    def get_cached_cameras(self):
+        """Devuelve las cámaras de la última búsqueda con el mismo backend (lista vacía si no hay)."""
         try:
-            return [f for f in os.listdir(IMAGES_DIR) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        except FileNotFoundError:
-            # Añadimos un print para depuración
-            print(f"Error: No se encontró el directorio de imágenes en: {IMAGES_DIR}")
+            with open(CAMERA_CACHE_FILE, encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
             return []
+        if cache.get('backend') != self.capture_backend: return []
+        return [int(i) for i in cache.get('cameras', [])]
 
-    def load_classifier(self, cascade_name):
-        """Carga un clasificador Haar Cascade."""
-        if not cascade_name: return False
-        cascade_path = os.path.join(HAARCASCADE_DIR, cascade_name)
-        self.classifier = cv2.CascadeClassifier(cascade_path)
-        return not self.classifier.empty()
+    def _save_camera_cache(self, cameras):
+        try:
+            os.makedirs(os.path.dirname(CAMERA_CACHE_FILE), exist_ok=True)
+            with open(CAMERA_CACHE_FILE, 'w', encoding='utf-8') as f:
+                json.dump({'backend': self.capture_backend, 'cameras': cameras}, f)
+        except OSError as e:
+            print(f"Advertencia: no se pudo guardar la lista de cámaras: {e}")
 
-    def process_static_image(self, image_name):
-        """Procesa una imagen estática y emite el resultado."""
-        if self.classifier is None or not image_name: return
+    def set_detect_every(self, frames):
+        """Escaneo completo cada `frames` fotogramas; entre medias se siguen las cajas previas."""
+        self.detect_every = max(1, frames)
+
+    def set_motion_gate(self, enabled):
+        """
+        Activa el filtro de movimiento en las cámaras: sin movimiento no se detecta y
+        se conservan las cajas anteriores; con movimiento solo se recorren las regiones
+        que cambiaron. Los umbrales se ajustan con set_motion_thresholds().
+        """
+        if enabled and not self.motion_gate_enabled:
+            # El fondo guardado puede ser de hace mucho: empezar con un escaneo completo
+            for session in list(self.sessions.values()):
+                session.motion_gate.reset()
+        self.motion_gate_enabled = enabled
+
+    def set_motion_thresholds(self, camera_index=None, diff_threshold=None, min_changed_fraction=None,
+                              background_rate=None, region_margin=None):
+        """
+        Ajusta los umbrales del filtro de movimiento (ver motion.py); los que quedan en
+        None no cambian. Sin `camera_index` se aplican a todas las cámaras activas y a
+        las que se abran después; con él, solo a esa cámara (una escena concreta).
+        """
+        thresholds = {name: value for name, value in (
+            ('diff_threshold', diff_threshold), ('min_changed_fraction', min_changed_fraction),
+            ('background_rate', background_rate), ('region_margin', region_margin)) if value is not None}
+        if camera_index is None:
+            self.motion_thresholds.update(thresholds)
+            sessions = list(self.sessions.values())
+        else:
+            session = self.sessions.get(camera_index)
+            if session is None: return False
+            sessions = [session]
+        for session in sessions:
+            for name, value in thresholds.items():
+                setattr(session.motion_gate, name, value)
+        return True
+
+    def set_quality_target(self, target_fps=None, latency_ms=None):
+        """
+        Activa el control adaptativo de calidad en las cámaras: cada una ajusta su
+        resolución de detección, scaleFactor y salto de fotogramas para sostener
+        `target_fps` y/o no pasar de `latency_ms` por fotograma. Sin objetivo se
+        desactiva y se vuelve a la calidad configurada.
+        """
+        self.quality_target = (target_fps or None, latency_ms or None)
+        for session in list(self.sessions.values()):
+            session.quality.set_target(*self.quality_target)
+
+    def load_classifier_async(self, cascade_name):
+        """
+        Carga el clasificador en segundo plano y al terminar lo deja como cascada
+        por defecto (imágenes y cámaras que se abran después). Las cámaras activas
+        conservan la suya: se cambia por cámara con set_stream_cascade().
+        Emite classifier_loaded al terminar.
+        """
+        if not cascade_name: return
+        self._load_generation += 1
+        self._loader.submit(self._load_in_background, cascade_name, self._load_generation)
+
+    def _load_in_background(self, cascade_name, generation):
+        success = self.classifier_cache.load(os.path.join(HAARCASCADE_DIR, cascade_name))
+        # Si mientras tanto se pidió otra cascada, esta carga solo sirve para calentar la caché
+        if generation != self._load_generation: return
+        if success:
+            self.cascade_name = cascade_name
+        self.classifier_loaded.emit(cascade_name, success)
+
+    def set_stream_cascade(self, camera_index, cascade_name):
+        """
+        Cambia la cascada de una sola cámara. La carga corre en segundo plano, como
+        en load_classifier_async(); la cámara sigue con la anterior hasta que termina.
+        Emite stream_cascade_loaded. Devuelve False si la cámara no está activa.
+        """
+        if camera_index not in self.sessions or not cascade_name: return False
+        generation = self._stream_load_generation.get(camera_index, 0) + 1
+        self._stream_load_generation[camera_index] = generation
+        self._loader.submit(self._load_stream_cascade, camera_index, cascade_name, generation)
+        return True
 
-        image_path = os.path.join(IMAGES_DIR, image_name)
-        image = cv2.imread(image_path)
-        if image is None: return
+    def _load_stream_cascade(self, camera_index, cascade_name, generation):
+        success = self.classifier_cache.load(os.path.join(HAARCASCADE_DIR, cascade_name))
+        if generation != self._stream_load_generation.get(camera_index): return
+        session = self.sessions.get(camera_index)
+        if session is None: return
+        if success:
+            session.cascade_name = cascade_name
+        self.stream_cascade_loaded.emit(camera_index, cascade_name, success)
 
-        processed_image, detections = self._perform_detection(image)
+    def process_static_image(self, image_name):
+        """Procesa una imagen estática (ver Detector.analyze_image) y emite el resultado."""
+        result = self.analyze_image(image_name)
+        if result is None: return
+        processed_image, detections = result
         self.frame_updated.emit(processed_image)
         self.detection_completed.emit(len(detections))
 
     def start_camera(self, camera_index): # Ahora recibe el índice como argumento
-        """Inicia la captura de video desde la cámara especificada."""
-        if self.classifier is None: return False
+        """
+        Inicia la captura de video desde la cámara especificada, con la cascada
+        seleccionada. Se pueden tener varias cámaras activas a la vez.
+        """
+        if self.cascade_name is None: return False
+        if camera_index in self.sessions: return True
         
         # Usa el índice que nos pasa el controlador
-        self.video_capture = cv2.VideoCapture(camera_index, cv2.CAP_MSMF)
-        if not self.video_capture.isOpened():
-            self.video_capture = None
+        video_capture = cv2.VideoCapture(camera_index, CAPTURE_BACKENDS[self.capture_backend])
+        if not video_capture.isOpened():
             return False
 
-        self.is_camera_active = True
-        self.timer.start(30) # ~33 FPS
+        session = CameraSession(camera_index, video_capture, self.cascade_name, self.scheduler,
+                                detect=self._detect_stream, render=self._render_stream,
+                                on_stopped=self._on_stream_stopped,
+                                capture_queue_size=CAPTURE_QUEUE_SIZE, render_queue_size=RENDER_QUEUE_SIZE,
+                                queue_timeout=QUEUE_TIMEOUT, metrics=self.metrics)
+        session.tracker = BoxTracker(self.detect_every)
+        session.motion_gate = MotionGate(**self.motion_thresholds)
+        session.quality = QualityController(*self.quality_target)
+        self.sessions[camera_index] = session
+        session.start()
         return True
 
-    def stop_camera(self):
-        """Detiene la captura de video."""
-        self.is_camera_active = False
-        self.timer.stop()
-        if self.video_capture:
-            self.video_capture.release()
-            self.video_capture = None
-            
-    def _update_frame(self):
-        """Captura y procesa un fotograma de la cámara."""
-        if not self.video_capture: return
-
-        ret, frame = self.video_capture.read()
-        if not ret:
-            self.stop_camera()
-            return
-        
-        processed_frame, _ = self._perform_detection(frame)
-        self.frame_updated.emit(processed_frame)
+    def stop_camera(self, camera_index=None):
+        """Detiene la captura de la cámara indicada, o de todas si no se indica ninguna."""
+        indexes = list(self.sessions) if camera_index is None else [camera_index]
+        for index in indexes:
+            session = self.sessions.pop(index, None)
+            if session is not None:
+                session.stop()
+
+    def get_pipeline_stats(self):
+        """
+        Devuelve, por cámara, la profundidad de cada cola, los fotogramas descartados,
+        los FPS y la latencia, junto con el total de descartes y la latencia por etapa.
+        """
+        streams = {index: session.snapshot() for index, session in list(self.sessions.items())}
+        return {
+            'workers': self.scheduler.workers,
+            'dropped': sum(stats['dropped'] for stats in streams.values()),
+            'streams': streams,
+            'stages': self.metrics.snapshot(),
+            'recorder': self.recorder.stats() if self.recorder is not None else None,
+        }
+
+    def start_recording(self, output_dir, **options):
+        """
+        Graba en segundo plano los fotogramas con detecciones de todas las cámaras.
+        `options` se pasan a DetectionRecorder (modo, formato, calidad...).
+        """
+        self.stop_recording()
+        self.recorder = DetectionRecorder(output_dir, **options).start()
+
+    def stop_recording(self):
+        """Detiene la grabación después de escribir lo pendiente."""
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.stop()
+
+    def save_image_async(self, image, path, stream_id=None):
+        """
+        Guarda la imagen fuera del hilo de la UI; al terminar se emite image_saved.
+        Si es un fotograma de la cámara `stream_id`, queda retenido hasta escribirse.
+        """
+        if self._image_writer is None:
+            self._image_writer = DetectionRecorder(os.path.dirname(path)).start()
+        self.retain_frame(stream_id, image)
+        def on_done(saved_path, error):
+            self.release_frame(stream_id, image)
+            self.image_saved.emit(saved_path, error or '')
+        self._image_writer.save(image, path, on_done)
+
+    def retain_frame(self, stream_id, frame):
+        """Impide que el fotograma de la cámara vuelva al anillo hasta release_frame()."""
+        session = self.sessions.get(stream_id)
+        if session is not None:
+            session.frames.retain(frame)
+
+    def release_frame(self, stream_id, frame):
+        """Devuelve al anillo de la cámara un fotograma retenido (visor, Guardar Resultado)."""
+        session = self.sessions.get(stream_id)
+        if session is not None:
+            session.frames.release(frame)
+
+    def shutdown(self):
+        """Detiene cámaras y escrituras pendientes (al cerrar la aplicación)."""
+        self.stop_camera()
+        self.stop_recording()
+        if self._image_writer is not None:
+            self._image_writer.stop()
+            self._image_writer = None
+
+    # --- Etapas del pipeline (se ejecutan en hilos de trabajo) ---
+    def _detect_stream(self, session, frame):
+        """Etapa de detección de una cámara (en un hilo del pool compartido)."""
+        start = time.perf_counter()
+        detections = self._detect_live(frame, session)
+        # Con más cámaras que hilos, a cada una le toca una parte del pool (y del presupuesto)
+        share = min(1.0, self.scheduler.workers / max(1, len(self.sessions)))
+        session.quality.record(time.perf_counter() - start, share)
+        return detections
+
+    def _render_stream(self, session, frame, detections):
+        """Etapa de render de una cámara: dibuja y entrega el fotograma a la UI."""
+        frames = session.frames
+        recorder = self.recorder
+        if recorder is not None and recorder.mode == 'crops':
+            # Los recortes se copian al encolar, antes de dibujar: llevan solo los píxeles originales
+            recorder.submit(session.stream_id, frame, detections)
+        with self.metrics.time('draw'):
+            self._draw_detections(frame, detections)
+        if recorder is not None:
+            recorder.log(session.stream_id, detections, session.cascade_name, frames.sequence(frame))
+            if recorder.mode == 'frame':
+                # Solo se encola: la codificación y la escritura corren en el hilo del grabador,
+                # que devuelve el búfer al terminar
+                frames.retain(frame)
+                if not recorder.submit(session.stream_id, frame, detections, release=frames.release):
+                    frames.release(frame)
+        if not session.stopped:
+            # La referencia del visor la devuelve el controlador cuando llega el siguiente fotograma
+            frames.retain(frame)
+            self.stream_frame_updated.emit(session.stream_id, frame, frames.sequence(frame))
+
+    def _on_stream_stopped(self, session):
+        self.stream_stopped.emit(session.stream_id)
+
+    def _detect_live(self, frame, session):
+        """
+        Detección de video: filtro de movimiento opcional, escaneo completo cada N
+        fotogramas y seguimiento entre medias, con los parámetros que fije el
+        control adaptativo de calidad si está activo.
+        """
+        cascade_name = session.cascade_name
+        untracked = self.cascade_graph is not None or self.cascade_set is not None
+        quality = session.quality
+        if quality.enabled:
+            # Sin seguimiento, el intervalo del usuario no aplica: solo el del nivel de calidad
+            detection_width, scale_factor, detect_every = quality.settings(
+                frame.shape[1], self.detection_width, 1 if untracked else self.detect_every)
+        else:
+            detection_width, scale_factor, detect_every = self.detection_width, SCALE_FACTOR, self.detect_every
+
+        gate = session.motion_gate if self.motion_gate_enabled else None
+        regions = None
+        if gate is not None:
+            key = (cascade_name, detection_width, scale_factor, self.cascade_graph is not None,
+                   self.cascade_set is not None)
+            with self.metrics.time('motion'):
+                regions = gate.check(frame, key)
+            if regions is not None and not regions:
+                return gate.detections # Sin movimiento: ni conversión a gris ni cascada
 
-    def _perform_detection(self, image):
-        """Función central de detección para cualquier imagen (estática o de video)."""
-        gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        detections = self.classifier.detectMultiScale(gray_image, 1.1, 5, minSize=(30, 30))
+        if untracked:
+            # Los niveles inferiores dependen del contenido de cada caja y las clases
+            # se fusionan en cada fotograma: no se siguen ni se limitan a regiones
+            if quality.enabled and not quality.frame_due(detect_every):
+                return quality.detections # Fotograma saltado por el nivel de calidad: se repite la salida
+            detections = quality.detections = self._detect(frame, cascade_name, detection_width,
+                                                           gray_image=self._stream_gray(session, frame))
+        else:
+            detections = self._detect_tracked(frame, session, cascade_name, gate, regions,
+                                              detection_width, scale_factor, detect_every)
+        if gate is not None:
+            gate.detections = detections
+        return detections
 
-        for (x, y, w, h) in detections:
-            cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 125), 2)
-            
-        return image, detections
+    def _stream_gray(self, session, frame):
+        """Gris del fotograma sobre el búfer fijo de la cámara."""
+        with self.metrics.time('gray'):
+            return session.frames.gray(frame)
 
+    def _detect_tracked(self, frame, session, cascade_name, gate, regions, detection_width, scale_factor,
+                        detect_every):
+        gray_image = self._stream_gray(session, frame)
+        frame_width = gray_image.shape[1]
+        region_width = lambda gray: self._region_width(gray, frame_width, detection_width)
+        scan = lambda gray: self._detect_gray(gray, cascade_name, region_width(gray), scale_factor)
+        if gate is not None:
+            full_scan = scan
+            scan = lambda gray: gate.scan(gray, regions, full_scan)
+        tracker = session.tracker
+        tracker.detect_every = detect_every
+        with self.metrics.time('detect'):
+            if tracker.detect_every <= 1:
+                return scan(gray_image)
+            # Las cajas de otro clasificador no sirven: forzar un escaneo completo
+            if cascade_name != session.tracked_cascade:
+                session.tracked_cascade = cascade_name
+                tracker.reset()
+            return tracker.update(gray_image, scan)
@@ -0,0 +1,161 @@
+# motion.py
+import cv2
+import numpy as np
+
+# --- Parámetros del filtro de movimiento ---
+MOTION_WIDTH = 160 # Ancho de la copia reducida sobre la que se busca movimiento
+BLUR_SIZE = 5 # Suavizado previo para que el ruido del sensor no cuente como movimiento
+DIFF_THRESHOLD = 25 # Diferencia de gris (0-255) a partir de la cual un píxel cambió
+MIN_CHANGED_FRACTION = 0.002 # Fracción mínima de píxeles cambiados para considerar que hubo movimiento
+BACKGROUND_RATE = 0.05 # Velocidad con la que el fondo absorbe los cambios (iluminación, objetos que se quedan)
+REGION_MARGIN = 0.5 # Cuánto se amplía cada región de movimiento (fracción de su tamaño) antes de detectar
+FULL_SCAN_FRACTION = 0.5 # Si las regiones cubren más que esto del fotograma, se escanea completo
+
+
+class MotionGate:
+    """
+    Filtro previo a la detección: compara cada fotograma, reducido y en gris, con un
+    fondo que se actualiza lentamente. Sin movimiento, la detección se omite y se
+    conservan las cajas anteriores; con movimiento, la cascada solo recorre las
+    regiones que cambiaron (ampliadas con un margen).
+    """
+    def __init__(self, diff_threshold=DIFF_THRESHOLD, min_changed_fraction=MIN_CHANGED_FRACTION,
+                 background_rate=BACKGROUND_RATE, region_margin=REGION_MARGIN, motion_width=MOTION_WIDTH):
+        self.diff_threshold = diff_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.background_rate = background_rate
+        self.region_margin = region_margin
+        self.motion_width = motion_width
+        self.detections = np.empty((0, 4), dtype=np.int32) # Última salida, se repite mientras no haya movimiento
+        self.frames = 0
+        self.skipped_frames = 0
+        self.partial_frames = 0
+        self.scanned_pixels = 0
+        self.total_pixels = 0
+        self.reset()
+
+    def reset(self):
+        """Olvida el fondo y la clave: el próximo fotograma hará un escaneo completo."""
+        self._background = None
+        self._key = None
+
+    def reset_stats(self):
+        self.frames = 0
+        self.skipped_frames = 0
+        self.partial_frames = 0
+        self.scanned_pixels = 0
+        self.total_pixels = 0
+
+    def check(self, frame, key=None):
+        """
+        Analiza un fotograma BGR y devuelve:
+        - [] si no hubo movimiento (la detección se puede omitir),
+        - una lista de regiones (x, y, w, h) en coordenadas del fotograma donde buscar,
+        - None si hace falta un escaneo completo (primer fotograma, cambio de `key`
+          o movimiento en gran parte de la imagen).
+        `key` identifica la configuración de detección; si cambia, las cajas
+        anteriores ya no sirven.
+        """
+        height, width = frame.shape[:2]
+        self.frames += 1
+        self.total_pixels += height * width
+
+        # Submuestreo por pasos (una vista, sin interpolar) antes de pasar a gris: así nunca
+        # se procesa el fotograma completo; el suavizado posterior absorbe el aliasing
+        step = max(1, width // self.motion_width)
+        scale = 1.0 / step
+        small = cv2.cvtColor(frame[::step, ::step], cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (BLUR_SIZE, BLUR_SIZE), 0)
+
+        if self._background is None or key != self._key:
+            self._background = small.astype(np.float32)
+            self._key = key
+            self.scanned_pixels += height * width
+            return None
+
+        diff = cv2.absdiff(small, cv2.convertScaleAbs(self._background))
+        cv2.accumulateWeighted(small, self._background, self.background_rate)
+        _, mask = cv2.threshold(diff, self.diff_threshold, 255, cv2.THRESH_BINARY)
+        if cv2.countNonZero(mask) < self.min_changed_fraction * mask.size:
+            self.skipped_frames += 1
+            return []
+
+        mask = cv2.dilate(mask, None, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        regions = self._merge([self._expand(cv2.boundingRect(c), scale, width, height) for c in contours])
+        # Una caja anterior que toca una región se busca entera: si la región la cortara, se perdería
+        # (con margen: detectMultiScale necesita ver la caja en varias posiciones para confirmarla).
+        # Al crecer, la región puede tocar otras cajas: se repite hasta que no cambie.
+        pending = self._previous_boxes()
+        while True:
+            touching = [box for box in pending if any(self._overlaps(box, region) for region in regions)]
+            if not touching: break
+            pending = [box for box in pending if box not in touching]
+            regions = self._merge(regions + [self._expand(box, 1.0, width, height) for box in touching])
+        area = sum(w * h for _, _, w, h in regions)
+        if area > FULL_SCAN_FRACTION * width * height:
+            self.scanned_pixels += height * width
+            return None
+        self.partial_frames += 1
+        self.scanned_pixels += area
+        return regions
+
+    def scan(self, gray_image, regions, detect):
+        """
+        Ejecuta `detect` (imagen en gris -> cajas) solo sobre las regiones indicadas,
+        o sobre toda la imagen si `regions` es None. Las cajas anteriores que quedan
+        fuera de las regiones con movimiento se conservan: lo que no se movió sigue ahí.
+        """
+        if regions is None:
+            return detect(gray_image)
+        found = []
+        for x, y, w, h in regions:
+            # Rebanada de NumPy: una vista sobre el mismo búfer, sin copiar píxeles
+            boxes = detect(gray_image[y:y + h, x:x + w])
+            found.extend((bx + x, by + y, bw, bh) for bx, by, bw, bh in boxes)
+        for box in self._previous_boxes():
+            if not any(self._overlaps(box, region) for region in regions):
+                found.append(tuple(box))
+        return np.array(found, dtype=np.int32).reshape(-1, 4)
+
+    def stats(self):
+        return {
+            'motion_frames': self.frames,
+            'motion_skipped_frames': self.skipped_frames,
+            'motion_partial_frames': self.partial_frames,
+            'motion_skipped_pixels': 1.0 - self.scanned_pixels / self.total_pixels if self.total_pixels else 0.0,
+        }
+
+    def _previous_boxes(self):
+        """Cajas de la última salida (las detecciones anidadas aportan su caja exterior)."""
+        return [tuple(int(v) for v in (box['box'] if isinstance(box, dict) else box)) for box in self.detections]
+
+    def _expand(self, rect, scale, width, height):
+        """Lleva un rectángulo de la copia reducida al fotograma completo y lo amplía con el margen."""
+        x, y, w, h = (v / scale for v in rect)
+        margin_x, margin_y = w * self.region_margin, h * self.region_margin
+        x0, y0 = max(0, int(x - margin_x)), max(0, int(y - margin_y))
+        x1, y1 = min(width, int(x + w + margin_x)), min(height, int(y + h + margin_y))
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    def _merge(self, regions):
+        """Une las regiones que se tocan hasta que no quede ninguna superpuesta."""
+        regions = list(regions)
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(regions)):
+                for j in range(i + 1, len(regions)):
+                    if self._overlaps(regions[i], regions[j]):
+                        ax, ay, aw, ah = regions[i]
+                        bx, by, bw, bh = regions.pop(j)
+                        x0, y0 = min(ax, bx), min(ay, by)
+                        regions[i] = (x0, y0, max(ax + aw, bx + bw) - x0, max(ay + ah, by + bh) - y0)
+                        merged = True
+                        break
+                if merged: break
+        return regions
+
+    @staticmethod
+    def _overlaps(a, b):
+        return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
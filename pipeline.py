@@ -0,0 +1,277 @@
+# pipeline.py
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from buffers import FRAME_POOL_SIZE, FramePool
+
+
+class FrameQueue:
+    """
+    Cola acotada para unir las etapas del pipeline de video.
+    Cuando está llena descarta el elemento más antiguo, de modo que la etapa
+    lenta siempre trabaja con el fotograma más reciente.
+    `on_drop` recibe cada elemento descartado o vaciado (p. ej. para devolver su búfer).
+    """
+    def __init__(self, maxsize, on_drop=None):
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self._items = deque()
+        self._condition = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        """Encola un elemento; si la cola está llena, descarta el más antiguo."""
+        dropped = None
+        with self._condition:
+            if len(self._items) >= self.maxsize:
+                dropped = self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._condition.notify()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+
+    def get(self, timeout=None):
+        """Devuelve el siguiente elemento o None si se agota el tiempo de espera."""
+        with self._condition:
+            if not self._items:
+                self._condition.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def clear(self):
+        """Vacía la cola sin contar los elementos como descartados."""
+        with self._condition:
+            items = list(self._items)
+            self._items.clear()
+        if self.on_drop is not None:
+            for item in items:
+                self.on_drop(item)
+
+    def reset_stats(self):
+        with self._condition:
+            self.dropped = 0
+
+    def __len__(self):
+        with self._condition:
+            return len(self._items)
+
+
+class StreamStats:
+    """FPS y latencia (captura -> render) de un stream sobre una ventana deslizante."""
+    def __init__(self, window=60):
+        self._render_times = deque(maxlen=window)
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, captured_at):
+        now = time.perf_counter()
+        with self._lock:
+            self._render_times.append(now)
+            self._latencies.append(now - captured_at)
+
+    def snapshot(self):
+        with self._lock:
+            times = list(self._render_times)
+            latencies = sorted(self._latencies)
+        fps = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0
+        return {
+            'fps': fps,
+            'latency_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+            'latency_max_ms': latencies[-1] * 1000 if latencies else 0.0,
+        }
+
+
+class CameraSession:
+    """
+    Un stream de cámara: hilo de captura propio, cola hacia la detección,
+    cola hacia el render y su propia cascada seleccionada.
+    La detección no corre aquí sino en el DetectionScheduler compartido.
+    Los fotogramas salen del anillo `frames` (FramePool): la referencia de la
+    captura pasa por las colas y se devuelve al terminar el render o al descartarse.
+    """
+    def __init__(self, stream_id, video_capture, cascade_name, scheduler, detect, render, on_stopped,
+                 capture_queue_size=2, render_queue_size=2, queue_timeout=0.1, metrics=None,
+                 pool_size=FRAME_POOL_SIZE):
+        self.stream_id = stream_id
+        self.video_capture = video_capture
+        self.cascade_name = cascade_name
+        self.scheduler = scheduler
+        self.frames = FramePool(pool_size)
+        release = lambda item: self.frames.release(item[1])
+        self.capture_queue = FrameQueue(capture_queue_size, on_drop=release)
+        self.render_queue = FrameQueue(render_queue_size, on_drop=release)
+        self.stats = StreamStats()
+        self.metrics = metrics # StageMetrics compartido (opcional)
+        # Estado por stream que usa la función de detección (p. ej. el seguimiento)
+        self.tracker = None
+        self.tracked_cascade = None
+        self.motion_gate = None
+        self.quality = None
+        self.busy = False # Hay un fotograma de este stream en el pool (lo gestiona el scheduler)
+
+        self._detect = detect
+        self._render = render
+        self._on_stopped = on_stopped
+        self._queue_timeout = queue_timeout
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name=f"captura-{self.stream_id}", daemon=True),
+            threading.Thread(target=self._render_loop, name=f"render-{self.stream_id}", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        self.scheduler.add(self)
+
+    def stop(self):
+        """Detiene los hilos del stream y libera la cámara."""
+        self._stop_event.set()
+        self.scheduler.remove(self)
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        self._threads = []
+        self.capture_queue.clear()
+        self.render_queue.clear()
+        self.video_capture.release()
+
+    @property
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def process(self, item):
+        """Etapa de detección: la ejecuta un hilo del pool compartido."""
+        captured_at, frame = item
+        try:
+            detections = self._detect(self, frame)
+        except Exception:
+            self.frames.release(frame)
+            raise
+        self.render_queue.put((captured_at, frame, detections))
+
+    def snapshot(self):
+        stats = self.stats.snapshot()
+        stats.update({
+            'cascade': self.cascade_name,
+            'capture_queue': len(self.capture_queue),
+            'render_queue': len(self.render_queue),
+            'capture_dropped': self.capture_queue.dropped,
+            'render_dropped': self.render_queue.dropped,
+            'dropped': self.capture_queue.dropped + self.render_queue.dropped,
+        })
+        stats.update(self.frames.stats())
+        if self.tracker is not None:
+            stats.update(self.tracker.stats())
+        if self.motion_gate is not None:
+            stats.update(self.motion_gate.stats())
+        if self.quality is not None:
+            stats.update(self.quality.stats())
+        return stats
+
+    def _capture_loop(self):
+        """Lee fotogramas de la cámara y los encola para detección."""
+        while not self._stop_event.is_set():
+            start = time.perf_counter()
+            ret, frame = self.frames.read(self.video_capture)
+            if self.metrics is not None:
+                self.metrics.record('capture', time.perf_counter() - start)
+            if not ret:
+                self._stop_event.set()
+                self._on_stopped(self)
+                return
+            self.capture_queue.put((time.perf_counter(), frame))
+            self.scheduler.notify()
+
+    def _render_loop(self):
+        """Dibuja las detecciones y entrega el fotograma a la UI."""
+        while not self._stop_event.is_set():
+            item = self.render_queue.get(timeout=self._queue_timeout)
+            if item is None: continue
+            captured_at, frame, detections = item
+            try:
+                self._render(self, frame, detections)
+            finally:
+                # El visor y la grabación retienen su propia referencia si la necesitan
+                self.frames.release(frame)
+            self.stats.record(captured_at)
+
+
+class DetectionScheduler:
+    """
+    Pool de detección compartido por todos los streams, con un hilo por núcleo.
+    Reparte el trabajo por turnos (round-robin) y con como máximo un fotograma
+    de cada stream en curso, así ningún stream acapara el pool y el orden de
+    los fotogramas de cada stream se conserva.
+    """
+    def __init__(self, workers=None, queue_timeout=0.1):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="deteccion")
+        self._sessions = []
+        self._next = 0
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._queue_timeout = queue_timeout
+        self._thread = None
+
+    def add(self, session):
+        with self._condition:
+            self._sessions.append(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch_loop, name="planificador", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def remove(self, session):
+        with self._condition:
+            if session in self._sessions:
+                self._sessions.remove(session)
+            # Esperar a que termine su fotograma en curso antes de liberar la cámara
+            while session.busy:
+                self._condition.wait()
+
+    def notify(self):
+        """Avisa de que hay fotogramas nuevos en alguna cola de captura."""
+        with self._condition:
+            self._condition.notify_all()
+
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    self._condition.wait(self._queue_timeout)
+                    job = self._next_job()
+                self._in_flight += 1
+            self._executor.submit(self._run_job, *job)
+
+    def _next_job(self):
+        """Siguiente (sesión, fotograma) por turnos. Se llama con el candado tomado."""
+        if self._in_flight >= self.workers: return None
+        count = len(self._sessions)
+        for i in range(count):
+            session = self._sessions[(self._next + i) % count]
+            if session.busy: continue
+            item = session.capture_queue.get(timeout=0)
+            if item is None: continue
+            session.busy = True
+            self._next = (self._next + i + 1) % count
+            return session, item
+        return None
+
+    def _run_job(self, session, item):
+        try:
+            session.process(item)
+        except Exception as e:
+            print(f"Error en la detección del stream {session.stream_id}: {e}")
+        finally:
+            with self._condition:
+                session.busy = False
+                self._in_flight -= 1
+                self._condition.notify_all()
@@ -0,0 +1,171 @@
+# quality.py
+"""
+Control adaptativo de calidad de la detección en vivo.
+
+Cada cámara tiene un QualityController que mide cuánto cuesta la detección por
+fotograma y lo compara con un presupuesto (un FPS objetivo o una latencia máxima).
+Si el costo se pasa, baja un nivel: menos resolución de detección, un scaleFactor
+más grueso o escanear solo cada N fotogramas. Cuando vuelve a sobrar margen de
+forma sostenida, sube un nivel. Las decisiones quedan en stats().
+"""
+import time
+from collections import deque
+
+from detector import SCALE_FACTOR
+
+# Niveles de calidad, del mejor al más barato:
+# (fracción del ancho del fotograma sobre la que se detecta, scaleFactor, escaneo cada N fotogramas)
+QUALITY_LEVELS = (
+    (1.0, SCALE_FACTOR, 1),
+    (0.75, SCALE_FACTOR, 1),
+    (0.5, SCALE_FACTOR, 1),
+    (0.5, 1.2, 2),
+    (0.4, 1.2, 2),
+    (0.4, 1.3, 3),
+    (0.25, 1.3, 4),
+)
+MIN_DETECTION_WIDTH = 240 # Por debajo de este ancho la cascada ya no encuentra rostros útiles
+EVAL_FRAMES = 15 # Fotogramas medidos antes de cada decisión...
+EVAL_SECONDS = 1.0 # ...o segundos, lo que llegue antes (con fotogramas lentos no se espera 15)
+RECOVER_FRACTION = 0.6 # Se sube de nivel solo si el costo queda por debajo de esta fracción del presupuesto
+RECOVER_WINDOWS = 3 # Ventanas seguidas con margen antes de subir un nivel
+MAX_RECOVER_WINDOWS = 24 # Tope de la espera cuando subir de nivel falla una y otra vez
+MAX_DECISIONS = 8 # Decisiones recientes que se conservan para las estadísticas
+
+
+class QualityController:
+    """
+    Controlador por histéresis: baja un nivel en cuanto una ventana de EVAL_FRAMES
+    fotogramas (o EVAL_SECONDS) supera el presupuesto y sube uno tras RECOVER_WINDOWS ventanas seguidas
+    con margen. Si una subida se revierte en la ventana siguiente, la espera para la
+    próxima se duplica, así el nivel no oscila alrededor del límite.
+    Sin objetivo (target_fps y latency_ms en None) queda en el nivel 0 y no interviene.
+    """
+    def __init__(self, target_fps=None, latency_ms=None, levels=QUALITY_LEVELS):
+        self.levels = levels
+        self.target_fps = None
+        self.latency_ms = None
+        self.level = 0
+        self.detections = [] # Última salida, se repite en los fotogramas que el nivel salta
+        self.cost = None # Costo medio por fotograma de la última ventana (segundos)
+        self.changes = 0
+        self.decisions = deque(maxlen=MAX_DECISIONS)
+        self.settings_in_use = (None, levels[0][1], levels[0][2]) # Últimos parámetros aplicados
+        self.reset()
+        self.set_target(target_fps, latency_ms)
+
+    @property
+    def enabled(self):
+        return self.target_fps is not None or self.latency_ms is not None
+
+    def set_target(self, target_fps=None, latency_ms=None):
+        """Fija el objetivo (FPS, latencia de detección en ms o ambos); sin objetivo vuelve al nivel 0."""
+        self.target_fps = target_fps or None
+        self.latency_ms = latency_ms or None
+        if not self.enabled:
+            self.level = 0
+        self.reset()
+
+    def reset(self):
+        """Descarta las mediciones en curso (el nivel actual se conserva)."""
+        self._costs = []
+        self._window_start = None
+        self._good_windows = 0
+        self._recover_windows = RECOVER_WINDOWS
+        self._upgraded = False # La última decisión fue subir de nivel
+        self._frame = 0
+
+    def budget(self, share=1.0):
+        """
+        Presupuesto de detección por fotograma (segundos). `share` es la fracción del
+        pool de detección que le toca a esta cámara cuando varias lo comparten.
+        """
+        limits = []
+        if self.target_fps:
+            limits.append(1.0 / self.target_fps)
+        if self.latency_ms:
+            limits.append(self.latency_ms / 1000)
+        return min(limits) * share if limits else None
+
+    def settings(self, frame_width, detection_width=None, detect_every=1):
+        """
+        Parámetros efectivos del nivel actual: (ancho de detección o None, scaleFactor,
+        escaneo cada N fotogramas). Nunca mejoran lo que pidió el usuario: se toma el
+        menor de los anchos y el mayor de los intervalos.
+        """
+        fraction, scale_factor, every = self.levels[self.level]
+        width = detection_width or frame_width
+        if fraction < 1.0:
+            width = min(width, max(MIN_DETECTION_WIDTH, int(frame_width * fraction)))
+        self.settings_in_use = (width if width < frame_width else None, scale_factor, max(every, detect_every))
+        return self.settings_in_use
+
+    def frame_due(self, detect_every):
+        """Si toca detectar en este fotograma (en los modos sin seguimiento, el resto repite la salida)."""
+        due = self._frame % detect_every == 0
+        self._frame += 1
+        return due
+
+    def record(self, seconds, share=1.0):
+        """Registra el costo de detección de un fotograma y, al cerrar una ventana, decide el nivel."""
+        if not self.enabled: return
+        now = time.monotonic()
+        if self._window_start is None:
+            self._window_start = now - seconds
+        self._costs.append(seconds)
+        if len(self._costs) < EVAL_FRAMES and now - self._window_start < EVAL_SECONDS: return
+        # Media y no mediana: los fotogramas saltados cuentan, el pool ve el costo promedio
+        cost = self.cost = sum(self._costs) / len(self._costs)
+        self._costs = []
+        self._window_start = None
+        budget = self.budget(share)
+
+        if cost > budget:
+            self._good_windows = 0
+            if self._upgraded:
+                # La subida anterior no se sostuvo: esperar más antes de volver a intentarlo
+                self._recover_windows = min(self._recover_windows * 2, MAX_RECOVER_WINDOWS)
+            self._upgraded = False
+            if self.level < len(self.levels) - 1:
+                self._change(self.level + 1, cost, budget)
+            return
+
+        self._upgraded = False
+        if self.level == 0 or cost > budget * RECOVER_FRACTION:
+            self._good_windows = 0
+            return
+        self._good_windows += 1
+        if self._good_windows >= self._recover_windows:
+            self._good_windows = 0
+            self._upgraded = True
+            self._change(self.level - 1, cost, budget)
+            if self.level == 0:
+                self._recover_windows = RECOVER_WINDOWS
+
+    def stats(self):
+        width, scale_factor, detect_every = self.settings_in_use
+        budget = self.budget()
+        return {
+            'quality_enabled': self.enabled,
+            'quality_level': self.level,
+            'quality_max_level': len(self.levels) - 1,
+            'quality_detection_width': width,
+            'quality_scale_factor': scale_factor,
+            'quality_detect_every': detect_every,
+            'quality_cost_ms': self.cost * 1000 if self.cost is not None else None,
+            'quality_budget_ms': budget * 1000 if budget is not None else None,
+            'quality_changes': self.changes,
+            'quality_decisions': list(self.decisions),
+        }
+
+    def _change(self, level, cost, budget):
+        self.decisions.append({
+            't': round(time.time(), 3),
+            'from': self.level,
+            'to': level,
+            'cost_ms': round(cost * 1000, 2),
+            'budget_ms': round(budget * 1000, 2),
+        })
+        self.level = level
+        self.changes += 1
+        self._frame = 0
@@ -0,0 +1,304 @@
+# recorder.py
+"""
+Grabación asíncrona de detecciones.
+
+Los fotogramas (o los recortes de cada caja) se codifican y se escriben a disco
+en un hilo propio, de modo que la captura, la detección y la UI nunca esperan
+por la E/S. La cola es acotada: si el disco no da abasto, las peticiones nuevas
+se descartan y se cuentan, en lugar de acumular memoria.
+Cada imagen guardada se anota en un índice JSONL que rota por tamaño.
+Además, todas las detecciones de cada stream (no solo las de los fotogramas
+grabados) van a un archivo .rec por stream (ver records.py).
+"""
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import cv2
+
+from records import CHUNK_RECORDS, RecordWriter
+
+RECORD_MODES = ('frame', 'crops') # Fotograma anotado completo o un recorte por caja
+RECORD_FORMATS = ('jpg', 'png')
+JPEG_QUALITY = 90 # 0-100
+PNG_COMPRESSION = 3 # 0-9: más alto, archivos más chicos y codificación más lenta
+MAX_PENDING = 32 # Imágenes en espera de escribirse como máximo
+MIN_INTERVAL = 0.5 # Segundos mínimos entre dos grabaciones del mismo stream
+INDEX_FILE = 'index.jsonl'
+INDEX_MAX_BYTES = 10 * 1024 * 1024 # Al superarlo, el índice rota (index.1.jsonl, index.2.jsonl...)
+INDEX_BACKUPS = 5
+INDEX_BATCH = 16 # Líneas del índice escritas juntas antes de vaciar el búfer
+
+
+def encode_params(fmt, quality=JPEG_QUALITY, png_compression=PNG_COMPRESSION):
+    """Parámetros de cv2.imencode/imwrite para el formato indicado."""
+    if fmt == 'png':
+        return [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    return [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+
+def boxes_to_json(detections):
+    """Convierte las detecciones (planas o anidadas de detect_hierarchy) a listas serializables."""
+    result = []
+    for detection in detections:
+        if isinstance(detection, dict):
+            item = {
+                'label': detection.get('label'),
+                'box': [int(v) for v in detection['box']],
+                'children': {label: boxes_to_json(children) for label, children in detection['children'].items()},
+            }
+            if 'score' in detection:
+                item['score'] = int(detection['score'])
+            result.append(item)
+        else:
+            result.append([int(v) for v in detection])
+    return result
+
+
+def crop_boxes(frame, boxes):
+    """Copia la región de cada caja (ya en formato de boxes_to_json), recortada a la imagen."""
+    height, width = frame.shape[:2]
+    crops = []
+    for box in boxes:
+        x, y, w, h = box['box'] if isinstance(box, dict) else box
+        crops.append(frame[max(0, y):min(height, y + h), max(0, x):min(width, x + w)].copy())
+    return crops
+
+
+class DetectionRecorder:
+    """
+    Cola de escritura con un hilo propio. submit() nunca bloquea: devuelve False
+    si la petición se descartó (por intervalo mínimo o por cola llena).
+    En modo 'frame' las imágenes recibidas no se modifican ni se copian; quien las
+    entrega no debe volver a escribir sobre ellas; si vienen de un FramePool, submit()
+    recibe `release` y la llama cuando ya no las usa. Con `record_log`, log() anota las
+    detecciones de cada fotograma en el archivo .rec del stream.
+    """
+    def __init__(self, output_dir, mode='frame', fmt='jpg', quality=JPEG_QUALITY,
+                 png_compression=PNG_COMPRESSION, max_pending=MAX_PENDING, min_interval=MIN_INTERVAL,
+                 record_log=True):
+        if mode not in RECORD_MODES:
+            raise ValueError(f"Modo de grabación no soportado: {mode}")
+        if fmt not in RECORD_FORMATS:
+            raise ValueError(f"Formato no soportado: {fmt}")
+        self.output_dir = output_dir
+        self.mode = mode
+        self.fmt = fmt
+        self.min_interval = min_interval
+        self.record_log = record_log
+        self._params = encode_params(fmt, quality, png_compression)
+        self._jobs = queue.Queue(maxsize=max_pending)
+        self._last_submit = {} # stream -> instante de la última grabación aceptada
+        self._index = None
+        self._thread = None
+        self._logs = {} # stream -> [RecordWriter, siguiente fotograma, escritura ya encolada]
+        self._logs_lock = threading.Lock()
+        self.saved = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._write_loop, name="grabacion", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Escribe lo que quede pendiente y cierra el índice."""
+        if self._thread is None: return
+        self._jobs.put(None)
+        self._thread.join()
+        self._thread = None
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        with self._logs_lock:
+            logs, self._logs = self._logs, {}
+        for log, _, _ in logs.values():
+            log.close()
+
+    def submit(self, stream_id, frame, detections, release=None):
+        """
+        Encola la grabación de un fotograma con detecciones. Si se acepta,
+        `release(frame)` se llama desde el hilo de escritura al terminar con él;
+        si devuelve False, el fotograma sigue siendo de quien lo entregó.
+        En modo 'crops' los recortes se copian aquí mismo (son chicos) y `release`
+        se llama antes de volver: se puede dibujar sobre el fotograma enseguida.
+        """
+        if len(detections) == 0: return False
+        now = time.monotonic()
+        if now - self._last_submit.get(stream_id, float('-inf')) < self.min_interval:
+            return False
+        boxes = boxes_to_json(detections)
+        image = frame if self.mode == 'frame' else crop_boxes(frame, boxes)
+        if not self._enqueue(('record', stream_id, image, boxes, time.time(),
+                              release if self.mode == 'frame' else None), stream_id, now):
+            return False
+        if self.mode != 'frame' and release is not None:
+            release(frame)
+        return True
+
+    def log(self, stream_id, detections, label=None, sequence=0):
+        """
+        Anota las detecciones de un fotograma del stream con su número de captura
+        (`sequence`, el de FramePool.sequence()), así los fotogramas descartados por
+        el pipeline dejan un hueco en vez de correr la numeración. Sin número (0, un
+        fotograma fuera del anillo) se usa el siguiente al último anotado.
+        Se llama desde el hilo de render: aquí solo se acumulan filas; los bloques
+        los escribe el hilo del grabador, por la misma cola que las imágenes.
+        """
+        if not self.record_log: return False
+        with self._logs_lock:
+            if self._thread is None: return False
+            entry = self._logs.get(stream_id)
+            if entry is None:
+                stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                path = os.path.join(self.output_dir, f"{stream_id}_{stamp}.rec")
+                # Sin auto_flush el archivo se crea recién en el hilo del grabador
+                writer = RecordWriter(path, metadata={'stream': stream_id}, auto_flush=False)
+                entry = self._logs[stream_id] = [writer, 0, False]
+            frame_idx = sequence if sequence >= entry[1] else entry[1]
+            entry[1] = frame_idx + 1
+        if not entry[0].append_detections(frame_idx, time.time(), detections, label): return False
+        if entry[0].pending >= CHUNK_RECORDS and not entry[2]:
+            # Sin contar como descarte si la cola está llena: las filas siguen en el búfer
+            # y se vuelve a pedir la escritura con el próximo fotograma
+            try:
+                self._jobs.put_nowait(('flush_log', entry))
+                entry[2] = True
+            except queue.Full:
+                pass
+        return True
+
+    def save(self, image, path, on_done=None):
+        """
+        Guarda una imagen en `path` en segundo plano. `on_done(path, error)` se llama
+        desde el hilo de escritura, con error None si todo fue bien.
+        """
+        if not self._enqueue(('save', image, path, on_done)):
+            if on_done is not None:
+                on_done(path, "Cola de escritura llena")
+            return False
+        return True
+
+    def stats(self):
+        return {
+            'saved': self.saved,
+            'pending': self._jobs.qsize(),
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'logged': sum(log.appended for log, _, _ in list(self._logs.values())),
+        }
+
+    def _enqueue(self, job, stream_id=None, now=None):
+        if self._thread is None: return False
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        if stream_id is not None:
+            self._last_submit[stream_id] = now
+        return True
+
+    def _write_loop(self):
+        pending_lines = 0
+        while True:
+            try:
+                # Mientras haya trabajo se escribe sin vaciar el índice; se vacía al quedar ocioso
+                job = self._jobs.get(timeout=0.5 if pending_lines else None)
+            except queue.Empty:
+                self._flush_index()
+                pending_lines = 0
+                continue
+            if job is None: break
+            try:
+                if job[0] == 'record':
+                    self._record(*job[1:])
+                    pending_lines += 1
+                elif job[0] == 'flush_log':
+                    self._flush_log(job[1])
+                else:
+                    self._save(*job[1:])
+            except Exception as e:
+                self.errors += 1
+                print(f"Error al grabar la detección: {e}")
+            if pending_lines >= INDEX_BATCH:
+                self._flush_index()
+                pending_lines = 0
+                self._rotate_index()
+        self._flush_index()
+
+    def _flush_log(self, entry):
+        entry[2] = False
+        try:
+            entry[0].flush()
+        except OSError as e:
+            # Sin disco para el registro no tiene sentido seguir acumulando filas
+            self.record_log = False
+            self.errors += 1
+            print(f"Error al escribir el registro de detecciones: {e}")
+
+    def _flush_index(self):
+        if self._index is not None:
+            self._index.flush()
+
+    def _record(self, stream_id, image, boxes, timestamp, release):
+        try:
+            self._record_frame(stream_id, image, boxes, timestamp)
+        finally:
+            if release is not None:
+                release(image)
+
+    def _record_frame(self, stream_id, image, boxes, timestamp):
+        """`image` es el fotograma en modo 'frame' y la lista de recortes en modo 'crops'."""
+        stamp = datetime.fromtimestamp(timestamp).strftime('%Y%m%d_%H%M%S_%f')
+        if self.mode == 'frame':
+            files = [self._write_image(f"{stream_id}_{stamp}.{self.fmt}", image)]
+        else:
+            files = [self._write_image(f"{stream_id}_{stamp}_{i}.{self.fmt}", crop) for i, crop in enumerate(image)]
+        record = {'t': round(timestamp, 3), 'stream': stream_id, 'files': files, 'boxes': boxes}
+        if self._index is None:
+            # El índice se abre con la primera grabación: save() no lo necesita
+            self._index = open(os.path.join(self.output_dir, INDEX_FILE), 'a', encoding='utf-8')
+        self._index.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.saved += len(files)
+
+    def _save(self, image, path, on_done):
+        error = None
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            fmt = os.path.splitext(path)[1].lower().lstrip('.')
+            if not cv2.imwrite(path, image, encode_params('png' if fmt == 'png' else 'jpg')):
+                error = "OpenCV no pudo escribir el archivo"
+        except Exception as e:
+            error = str(e)
+        if error is None:
+            self.saved += 1
+        else:
+            self.errors += 1
+        if on_done is not None:
+            on_done(path, error)
+
+    def _write_image(self, filename, image):
+        ok, data = cv2.imencode('.' + self.fmt, image, self._params)
+        if not ok:
+            raise ValueError(f"No se pudo codificar {filename}")
+        with open(os.path.join(self.output_dir, filename), 'wb') as f:
+            f.write(data.tobytes())
+        return filename
+
+    def _rotate_index(self):
+        """Rota el índice al superar INDEX_MAX_BYTES, conservando INDEX_BACKUPS anteriores."""
+        if self._index.tell() < INDEX_MAX_BYTES: return
+        self._index.close()
+        base = os.path.join(self.output_dir, INDEX_FILE)
+        stem, ext = os.path.splitext(base)
+        for i in range(INDEX_BACKUPS - 1, 0, -1):
+            if os.path.exists(f"{stem}.{i}{ext}"):
+                os.replace(f"{stem}.{i}{ext}", f"{stem}.{i + 1}{ext}")
+        os.replace(base, f"{stem}.1{ext}")
+        self._index = open(base, 'a', encoding='utf-8')
@@ -0,0 +1,378 @@
+# records.py
+"""
+Registros de detección compactos y un formato binario para grabaciones largas.
+
+Cada detección es una fila de un arreglo estructurado de NumPy (RECORD_DTYPE:
+fotograma, marca de tiempo, cascada, caja y puntaje). Los archivos .rec guardan
+las filas tal cual, detrás de una cabecera fija, más un índice por fotograma al
+final, así que RecordFile los abre con np.memmap y consulta o reproduce millones
+de detecciones sin cargarlas en memoria.
+
+Uso:
+    python records.py info camara_0.rec
+    python records.py query camara_0.rec --frames 100:200
+    python records.py query camara_0.rec --seconds 12.5:20
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([
+    ('frame_idx', '<i8'),
+    ('timestamp', '<f8'), # Segundos (época en vivo, posición en el video en video.py)
+    ('cascade_id', '<u2'), # Posición en la tabla de cascadas de la cabecera
+    ('x', '<i4'),
+    ('y', '<i4'),
+    ('w', '<i4'),
+    ('h', '<i4'),
+    ('score', '<f4'), # Vecinos que respaldan la caja; NaN si el modo de detección no lo da
+])
+# Una entrada por fotograma con detecciones: dónde empiezan sus filas
+INDEX_DTYPE = np.dtype([('frame_idx', '<i8'), ('timestamp', '<f8'), ('start', '<i8')])
+MAGIC = b'HAARREC1'
+HEADER_SIZE = 4096 # Cabecera fija: las filas empiezan siempre en este desplazamiento
+FORMAT_VERSION = 1
+CHUNK_RECORDS = 4096 # Filas que se acumulan antes de escribirlas juntas
+SCAN_CHUNK = 1 << 20 # Filas que se leen por vez al reconstruir el índice de un archivo sin cerrar
+
+
+def make_records(frame_idx, timestamp, boxes, cascade_id=0, scores=None):
+    """Filas de un fotograma a partir de las cajas (x, y, w, h) de detectMultiScale."""
+    boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+    records = np.empty(len(boxes), dtype=RECORD_DTYPE)
+    records['frame_idx'] = frame_idx
+    records['timestamp'] = timestamp
+    records['cascade_id'] = cascade_id
+    for i, field in enumerate(('x', 'y', 'w', 'h')):
+        records[field] = boxes[:, i]
+    records['score'] = np.nan if scores is None else scores
+    return records
+
+
+def flatten_detections(detections, label=None):
+    """
+    Detecciones planas o anidadas (jerárquicas, de varias cascadas) como una lista
+    de (etiqueta, caja, puntaje o None); las planas llevan `label`.
+    """
+    flat = []
+    for detection in detections:
+        if isinstance(detection, dict):
+            flat.append((detection.get('label') or label, detection['box'], detection.get('score')))
+            for child_label, children in detection['children'].items():
+                flat.extend(flatten_detections(children, child_label))
+        else:
+            flat.append((label, detection, None))
+    return flat
+
+
+def build_index(records, chunk=SCAN_CHUNK):
+    """Índice por fotograma de filas ordenadas por fotograma, leyéndolas por bloques."""
+    entries = []
+    previous = None
+    for start in range(0, len(records), chunk):
+        frames = np.asarray(records['frame_idx'][start:start + chunk])
+        if len(frames) == 0: break
+        first = np.flatnonzero(np.diff(frames, prepend=frames[0] - 1 if previous is None else previous))
+        index = np.empty(len(first), dtype=INDEX_DTYPE)
+        index['frame_idx'] = frames[first]
+        index['timestamp'] = np.asarray(records['timestamp'][start:start + chunk])[first]
+        index['start'] = first + start
+        entries.append(index)
+        previous = frames[-1]
+    return np.concatenate(entries) if entries else np.empty(0, dtype=INDEX_DTYPE)
+
+
+def _read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("No es un archivo de detecciones (.rec)")
+    header = json.loads(f.read(HEADER_SIZE - len(MAGIC)).decode('utf-8'))
+    if header.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Versión de formato no soportada: {header.get('version')}")
+    if np.dtype([tuple(field) for field in header['dtype']]) != RECORD_DTYPE:
+        raise ValueError("El archivo usa otro tipo de registro")
+    return header
+
+
+def _record_count(header, file_size):
+    """Filas del archivo; si no se cerró bien (sin índice), se deducen del tamaño."""
+    if header.get('index_offset'):
+        return header['records']
+    return (file_size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+
+
+class RecordWriter:
+    """
+    Escribe registros en un archivo .rec. append() acepta bloques de cualquier
+    tamaño (en orden de fotograma) y los escribe por bloques de CHUNK_RECORDS;
+    close() agrega el índice y completa la cabecera. Es seguro llamarlo desde
+    varios hilos. Con `append=True` continúa un archivo existente; si además se
+    pasa `start_frame`, antes se descartan sus filas desde ese fotograma (como al
+    retomar una corrida interrumpida desde un punto anterior).
+    Con `auto_flush=False`, append() nunca toca el disco: el archivo se abre y las
+    filas se escriben en flush() (o en close()), que se puede llamar desde otro hilo.
+    """
+    def __init__(self, path, cascades=(), metadata=None, append=False, start_frame=None, auto_flush=True):
+        self.path = path
+        self.auto_flush = auto_flush
+        self.cascades = list(cascades)
+        self.metadata = dict(metadata or {})
+        self.count = 0 # Filas ya escritas en el archivo
+        self.appended = 0 # Filas recibidas en esta sesión (incluye las que esperan en el búfer)
+        self._pending = []
+        self._pending_count = 0
+        self._last_frame = None
+        self._lock = threading.Lock()
+        self._file = None
+        self._closed = False
+        self._resume_from = (start_frame,) if append and os.path.exists(path) else None
+        if auto_flush:
+            self._open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def cascade_id(self, name):
+        """Posición de la cascada (o etiqueta) en la tabla de la cabecera; la agrega si es nueva."""
+        with self._lock:
+            if name not in self.cascades:
+                self.cascades.append(name)
+            return self.cascades.index(name)
+
+    def append(self, records):
+        """Agrega filas de RECORD_DTYPE. Devuelve False si el escritor ya está cerrado."""
+        records = np.asarray(records, dtype=RECORD_DTYPE)
+        with self._lock:
+            if self._closed: return False
+            if len(records) == 0: return True
+            if self._last_frame is not None and records['frame_idx'][0] < self._last_frame:
+                raise ValueError("Los registros deben llegar en orden de fotograma")
+            self._last_frame = records['frame_idx'][-1]
+            self._pending.append(records)
+            self._pending_count += len(records)
+            self.appended += len(records)
+            if self.auto_flush and self._pending_count >= CHUNK_RECORDS:
+                self._flush()
+        return True
+
+    @property
+    def pending(self):
+        """Filas recibidas que todavía no se escribieron."""
+        return self._pending_count
+
+    def flush(self):
+        """Escribe las filas pendientes."""
+        with self._lock:
+            if not self._closed:
+                self._flush()
+
+    def append_detections(self, frame_idx, timestamp, detections, label=None):
+        """
+        Agrega las detecciones de un fotograma tal como salen del detector (cajas
+        sueltas o anidadas); cada etiqueta, o `label` para las cajas sueltas, se
+        guarda como cascada.
+        """
+        flat = flatten_detections(detections, label)
+        if not flat: return True
+        records = make_records(frame_idx, timestamp, [box for _, box, _ in flat],
+                               [self.cascade_id(name or '') for name, _, _ in flat],
+                               [np.nan if score is None else score for _, _, score in flat])
+        return self.append(records)
+
+    def close(self):
+        with self._lock:
+            if self._closed: return
+            self._closed = True
+            if self._file is None:
+                self._open()
+            self._flush()
+            # El índice se reconstruye a partir de las filas escritas: sirve igual al continuar un archivo
+            records = np.memmap(self._file, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE,
+                                shape=(self.count,)) if self.count else np.empty(0, dtype=RECORD_DTYPE)
+            index = build_index(records)
+            del records
+            index_offset = HEADER_SIZE + self.count * RECORD_DTYPE.itemsize
+            self._file.seek(index_offset)
+            self._file.truncate()
+            self._file.write(index.tobytes())
+            self._write_header(index_offset, len(index))
+            self._file.close()
+            self._file = None
+
+    def _open(self):
+        if self._resume_from is not None:
+            self._file = open(self.path, 'r+b')
+            self._resume(*self._resume_from)
+        else:
+            self._file = open(self.path, 'w+b')
+            self._write_header(index_offset=0, index_frames=0)
+
+    def _flush(self):
+        if not self._pending: return
+        if self._file is None:
+            self._open()
+        self._file.seek(HEADER_SIZE + self.count * RECORD_DTYPE.itemsize)
+        self._file.write(np.concatenate(self._pending).tobytes())
+        self.count += self._pending_count
+        self._pending = []
+        self._pending_count = 0
+        if len(self.cascades) != self._header_cascades:
+            # Etiquetas nuevas: la tabla de la cabecera se reescribe con las filas que las usan,
+            # así un archivo que no llega a cerrarse las conserva
+            self._write_header(index_offset=0, index_frames=0)
+        else:
+            self._file.flush()
+
+    def _resume(self, start_frame=None):
+        header = _read_header(self._file)
+        self.count = _record_count(header, os.path.getsize(self.path))
+        self.cascades = header['cascades'] + [name for name in self.cascades if name not in header['cascades']]
+        self.metadata = {**header['metadata'], **self.metadata}
+        if self.count and start_frame is not None:
+            # Las filas están ordenadas por fotograma: búsqueda binaria sobre el archivo mapeado
+            records = np.memmap(self._file, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(self.count,))
+            self.count = int(np.searchsorted(records['frame_idx'], start_frame))
+            del records
+        if self.count:
+            self._file.seek(HEADER_SIZE + (self.count - 1) * RECORD_DTYPE.itemsize)
+            last = np.frombuffer(self._file.read(RECORD_DTYPE.itemsize), dtype=RECORD_DTYPE)
+            self._last_frame = last['frame_idx'][0]
+        # Sin índice hasta el próximo close(): si el proceso muere, el archivo sigue siendo legible
+        self._file.truncate(HEADER_SIZE + self.count * RECORD_DTYPE.itemsize)
+        self._write_header(index_offset=0, index_frames=0)
+
+    def _write_header(self, index_offset, index_frames):
+        header = {
+            'version': FORMAT_VERSION,
+            'dtype': [list(field) for field in RECORD_DTYPE.descr],
+            'cascades': self.cascades,
+            'metadata': self.metadata,
+            'records': self.count,
+            'index_offset': index_offset,
+            'index_frames': index_frames,
+        }
+        data = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        if len(data) > HEADER_SIZE - len(MAGIC):
+            raise ValueError("Cabecera demasiado grande (demasiadas cascadas o metadatos)")
+        self._file.seek(0)
+        self._file.write(MAGIC + data.ljust(HEADER_SIZE - len(MAGIC)))
+        self._file.flush()
+        self._header_cascades = len(self.cascades)
+
+
+class RecordFile:
+    """
+    Lectura de un archivo .rec sin cargarlo: `records` es un np.memmap y las
+    consultas por fotograma o por tiempo usan el índice (búsqueda binaria) y
+    devuelven vistas. Un archivo que no se cerró bien se puede leer igual: el
+    índice se reconstruye recorriendo las filas por bloques.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = _read_header(f)
+        self.cascades = header['cascades']
+        self.metadata = header['metadata']
+        count = _record_count(header, os.path.getsize(path))
+        self.records = (np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+                        if count else np.empty(0, dtype=RECORD_DTYPE))
+        if header.get('index_offset') and header['index_frames']:
+            self.index = np.memmap(path, dtype=INDEX_DTYPE, mode='r', offset=header['index_offset'],
+                                   shape=(header['index_frames'],))
+        else:
+            self.index = build_index(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def frame(self, frame_idx):
+        """Filas de un fotograma (vacío si no tuvo detecciones)."""
+        return self.frames(frame_idx, frame_idx + 1)
+
+    def frames(self, start=None, stop=None):
+        """Filas de los fotogramas en [start, stop)."""
+        return self._slice(self.index['frame_idx'], start, stop)
+
+    def between(self, start=None, stop=None):
+        """Filas con marca de tiempo en [start, stop) segundos."""
+        return self._slice(self.index['timestamp'], start, stop)
+
+    def iter_frames(self, start=None, stop=None):
+        """Reproduce la grabación: (fotograma, marca de tiempo, filas) de cada fotograma con detecciones."""
+        frames = self.index['frame_idx']
+        first = 0 if start is None else int(np.searchsorted(frames, start))
+        last = len(frames) if stop is None else int(np.searchsorted(frames, stop))
+        for i in range(first, last):
+            end = self.index['start'][i + 1] if i + 1 < len(self.index) else len(self.records)
+            yield int(frames[i]), float(self.index['timestamp'][i]), self.records[self.index['start'][i]:end]
+
+    def cascade_name(self, cascade_id):
+        return self.cascades[cascade_id] if cascade_id < len(self.cascades) else None
+
+    def _slice(self, keys, start, stop):
+        first = 0 if start is None else int(np.searchsorted(keys, start))
+        last = len(keys) if stop is None else int(np.searchsorted(keys, stop))
+        if first >= last: return self.records[:0]
+        begin = self.index['start'][first]
+        end = self.index['start'][last] if last < len(self.index) else len(self.records)
+        return self.records[begin:end]
+
+
+def _parse_range(text, cast):
+    start, _, stop = text.partition(':')
+    return (cast(start) if start else None), (cast(stop) if stop else None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta de archivos de detecciones (.rec).")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    info = subparsers.add_parser('info', help="Resumen del archivo")
+    info.add_argument('path')
+    query = subparsers.add_parser('query', help="Detecciones de un rango, en JSONL")
+    query.add_argument('path')
+    query.add_argument('--frames', help="Rango de fotogramas inicio:fin (fin excluido)")
+    query.add_argument('--seconds', help="Rango de marcas de tiempo inicio:fin en segundos")
+    args = parser.parse_args(argv)
+
+    try:
+        rec = RecordFile(args.path)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if args.command == 'info':
+        frames = rec.index['frame_idx']
+        print(json.dumps({
+            'records': len(rec),
+            'frames_with_detections': len(frames),
+            'first_frame': int(frames[0]) if len(frames) else None,
+            'last_frame': int(frames[-1]) if len(frames) else None,
+            'cascades': rec.cascades,
+            'metadata': rec.metadata,
+        }, indent=2))
+        return 0
+
+    if args.seconds:
+        records = rec.between(*_parse_range(args.seconds, float))
+    else:
+        records = rec.frames(*_parse_range(args.frames or ':', int))
+    for row in records:
+        score = float(row['score'])
+        print(json.dumps({
+            'f': int(row['frame_idx']),
+            't': round(float(row['timestamp']), 3),
+            'cascade': rec.cascade_name(int(row['cascade_id'])),
+            'b': [int(row['x']), int(row['y']), int(row['w']), int(row['h'])],
+            'score': None if np.isnan(score) else score,
+        }, separators=(',', ':')))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
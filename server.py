@@ -0,0 +1,279 @@
+# server.py
+"""
+Servicio HTTP local de detección, sin interfaz gráfica.
+
+Recibe imágenes (JPEG/PNG en el cuerpo de la petición) y devuelve las cajas en JSON.
+Las peticiones se agrupan en micro-lotes por cascada y se reparten en un pool de
+hilos con clasificadores precargados. Si hay demasiadas peticiones en curso, las
+nuevas se rechazan con 503 en lugar de acumular latencia. Las conexiones son
+HTTP/1.1 persistentes y cada cliente se atiende en su propio hilo.
+
+Uso:
+    python server.py -c haarcascade_frontalface_default.xml --port 8080
+    curl --data-binary @imgPruebas/rostros.jpg "http://127.0.0.1:8080/detect?cascade=haarcascade_frontalface_default.xml"
+
+Rutas:
+    POST /detect?cascade=...&detection_width=...   cuerpo: la imagen codificada
+    GET  /health                                    200 si el servicio está listo
+    GET  /stats                                     estadísticas en JSON
+    GET  /metrics                                   estadísticas en formato Prometheus
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+from metrics import StageMetrics, format_prometheus
+from detector import HAARCASCADE_DIR, Detector, detect_scaled
+
+DEFAULT_PORT = 8080
+MAX_BATCH = 8 # Peticiones como máximo por micro-lote
+BATCH_WAIT = 0.002 # Segundos que se espera a completar un lote antes de despacharlo
+MAX_PENDING = 64 # Peticiones en curso a partir de las cuales se responde 503
+MAX_BODY = 32 * 1024 * 1024 # Tamaño máximo de imagen aceptado (bytes)
+REQUEST_TIMEOUT = 30.0 # Segundos que una petición espera su resultado
+
+
+class DetectionService:
+    """
+    Cola de peticiones con micro-lotes: un hilo despachador junta hasta `max_batch`
+    peticiones de la misma cascada (esperando como mucho `batch_wait`) y las entrega
+    juntas a un hilo del pool, que las procesa con un único clasificador prestado.
+    """
+    def __init__(self, model, workers=None, max_batch=MAX_BATCH, batch_wait=BATCH_WAIT, max_pending=MAX_PENDING):
+        self.model = model
+        self.workers = workers or os.cpu_count() or 1
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.max_pending = max_pending
+        self.metrics = StageMetrics()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="deteccion")
+        self._requests = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._idle_workers = threading.Semaphore(self.workers)
+        self.requests = 0
+        self.rejected = 0
+        self.batches = 0
+        self._thread = threading.Thread(target=self._batch_loop, name="micro-lotes", daemon=True)
+        self._thread.start()
+
+    def preload(self, cascade_names):
+        """Precarga un clasificador por hilo de trabajo para cada cascada. Devuelve las que fallaron."""
+        return [name for name in cascade_names
+                if not self.model.classifier_cache.preload(os.path.join(HAARCASCADE_DIR, name), self.workers)]
+
+    def submit(self, data, cascade_name, detection_width=None):
+        """Encola una imagen codificada. Devuelve un Future, o None si el servicio está saturado."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                return None
+            self._pending += 1
+            self.requests += 1 # Solo las aceptadas
+        future = Future()
+        self._requests.put((time.perf_counter(), data, cascade_name, detection_width, future))
+        return future
+
+    def stats(self):
+        with self._lock:
+            pending, requests, rejected, batches = self._pending, self.requests, self.rejected, self.batches
+        return {
+            'workers': self.workers,
+            'pending': pending,
+            'requests': requests,
+            'rejected': rejected,
+            'batches': batches,
+            'avg_batch': (requests - pending) / batches if batches else 0.0,
+            'stages': self.metrics.snapshot(),
+        }
+
+    def _batch_loop(self):
+        held = [] # Peticiones de otra cascada que quedan para el siguiente lote
+        while True:
+            batch = held or [self._requests.get()]
+            held = []
+            deadline = time.perf_counter() + self.batch_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    request = self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request[2:4] == batch[0][2:4]:
+                    batch.append(request)
+                else:
+                    held.append(request)
+                    break
+            # Solo se despacha cuando hay un hilo libre: mientras tanto el lote puede seguir creciendo
+            while not self._idle_workers.acquire(timeout=self.batch_wait):
+                while len(batch) < self.max_batch and not held:
+                    try:
+                        request = self._requests.get_nowait()
+                    except queue.Empty:
+                        break
+                    (batch if request[2:4] == batch[0][2:4] else held).append(request)
+            with self._lock:
+                self.batches += 1
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        try:
+            cascade_name, detection_width = batch[0][2], batch[0][3]
+            with self.model.classifier_cache.borrow(os.path.join(HAARCASCADE_DIR, cascade_name)) as classifier:
+                for queued_at, data, _, _, future in batch:
+                    self.metrics.record('queue', time.perf_counter() - queued_at)
+                    if classifier is None:
+                        future.set_exception(ValueError(f"No se pudo cargar el clasificador: {cascade_name}"))
+                        continue
+                    try:
+                        with self.metrics.time('decode'):
+                            gray_image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+                        if gray_image is None:
+                            raise ValueError("No se pudo decodificar la imagen")
+                        with self.metrics.time('detect'):
+                            boxes = detect_scaled(classifier, gray_image, detection_width)
+                        future.set_result((gray_image.shape[1], gray_image.shape[0], boxes))
+                    except Exception as e:
+                        future.set_exception(e)
+        finally:
+            with self._lock:
+                self._pending -= len(batch)
+            self._idle_workers.release()
+
+
+def make_handler(service, default_cascade):
+    class DetectionHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1' # Conexiones persistentes (keep-alive)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == '/health':
+                self._send_json(200, {'status': 'ok'})
+            elif path == '/stats':
+                self._send_json(200, service.stats())
+            elif path == '/metrics':
+                self._send(200, format_prometheus(service.stats()).encode('utf-8'),
+                           'text/plain; version=0.0.4; charset=utf-8')
+            else:
+                self._send_json(404, {'error': 'Ruta no encontrada'})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != '/detect':
+                self._send_json(404, {'error': 'Ruta no encontrada'})
+                return
+            length = self.headers.get('Content-Length')
+            if length is None:
+                self._send_json(411, {'error': 'Falta Content-Length'})
+                return
+            try:
+                length = int(length)
+                if length < 0: raise ValueError
+            except ValueError:
+                # Sin un largo válido no se puede saber dónde termina el cuerpo: se cierra la conexión
+                self.close_connection = True
+                self._send_json(400, {'error': 'Content-Length no válido'})
+                return
+            if length > MAX_BODY:
+                self.close_connection = True
+                self._send_json(413, {'error': 'Imagen demasiado grande'})
+                return
+            data = self.rfile.read(length)
+
+            params = parse_qs(url.query)
+            cascade_name = params.get('cascade', [default_cascade])[0]
+            if not cascade_name or os.path.basename(cascade_name) != cascade_name:
+                self._send_json(400, {'error': 'Cascada no válida'})
+                return
+            try:
+                detection_width = int(params['detection_width'][0]) if 'detection_width' in params else None
+            except ValueError:
+                detection_width = 0
+            if detection_width is not None and detection_width <= 0:
+                self._send_json(400, {'error': 'detection_width debe ser un entero positivo'})
+                return
+
+            start = time.perf_counter()
+            future = service.submit(data, cascade_name, detection_width)
+            if future is None:
+                self._send_json(503, {'error': 'Servicio saturado, reintente'}, {'Retry-After': '1'})
+                return
+            try:
+                width, height, boxes = future.result(timeout=REQUEST_TIMEOUT)
+            except ValueError as e:
+                self._send_json(400, {'error': str(e)})
+                return
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+            self._send_json(200, {
+                'cascade': cascade_name,
+                'width': width,
+                'height': height,
+                'boxes': boxes.tolist(),
+                'ms': round((time.perf_counter() - start) * 1000, 2),
+            })
+
+        def _send_json(self, status, payload, headers=None):
+            self._send(status, json.dumps(payload).encode('utf-8'), 'application/json', headers)
+
+        def _send(self, status, body, content_type, headers=None):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Sin una línea en consola por petición
+
+    return DetectionHandler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP local de detección Haar Cascade.")
+    parser.add_argument('-c', '--cascade', action='append', default=[],
+                        help="Cascada a precargar (se puede repetir); la primera es la predeterminada")
+    parser.add_argument('--host', default='127.0.0.1', help="Dirección de escucha")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Puerto de escucha")
+    parser.add_argument('-w', '--workers', type=int, help="Hilos de detección (por defecto, uno por núcleo)")
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help="Peticiones por micro-lote")
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING,
+                        help="Peticiones en curso a partir de las cuales se responde 503")
+    args = parser.parse_args(argv)
+
+    detector = Detector()
+    cascades = args.cascade or ['haarcascade_frontalface_default.xml']
+    service = DetectionService(detector, args.workers, args.max_batch, max_pending=args.max_pending)
+    failed = service.preload(cascades)
+    if failed:
+        print(f"Error: no se pudieron cargar: {', '.join(failed)}", file=sys.stderr)
+        return 1
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service, cascades[0]))
+    server.daemon_threads = True
+    print(f"Escuchando en http://{args.host}:{args.port} ({service.workers} hilos, "
+          f"cascadas: {', '.join(cascades)})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# tracking.py
+import cv2
+import numpy as np
+
+# --- Parámetros del seguimiento entre escaneos completos ---
+DETECT_EVERY = 1 # Escaneo completo cada N fotogramas (1 = en todos)
+SEARCH_MARGIN = 0.5 # Cuánto se amplía cada caja (fracción de su tamaño) para buscarla en el siguiente fotograma
+MIN_CONFIDENCE = 0.6 # Correlación mínima (TM_CCOEFF_NORMED) para dar por buena una caja seguida
+TEMPLATE_SIZE = 48 # Lado máximo de la plantilla; las cajas grandes se siguen a escala reducida
+
+
+class BoxTracker:
+    """
+    Propaga las cajas del último escaneo completo a los fotogramas siguientes
+    mediante template matching dentro de una región ampliada alrededor de cada caja.
+    Vuelve a escanear cuando toca según `detect_every` o cuando alguna caja
+    pierde confianza.
+    """
+    def __init__(self, detect_every=DETECT_EVERY, search_margin=SEARCH_MARGIN, min_confidence=MIN_CONFIDENCE):
+        self.detect_every = detect_every
+        self.search_margin = search_margin
+        self.min_confidence = min_confidence
+        self.full_scans = 0
+        self.tracked_frames = 0
+        self.low_confidence_rescans = 0
+        self.reset()
+
+    def reset(self):
+        """Olvida las cajas actuales: el próximo fotograma hará un escaneo completo."""
+        self._boxes = np.empty((0, 4), dtype=np.int32)
+        self._templates = []
+        self._frames_since_scan = None
+
+    def reset_stats(self):
+        self.full_scans = 0
+        self.tracked_frames = 0
+        self.low_confidence_rescans = 0
+
+    def update(self, gray_image, detect):
+        """
+        Devuelve las cajas del fotograma. `detect` es la función de escaneo completo
+        (recibe la imagen en gris y devuelve un arreglo de cajas).
+        """
+        due = self._frames_since_scan is None or self._frames_since_scan + 1 >= self.detect_every
+        if not due:
+            boxes = self._track(gray_image)
+            if boxes is not None:
+                self._frames_since_scan += 1
+                self.tracked_frames += 1
+                return boxes
+            self.low_confidence_rescans += 1
+
+        boxes = detect(gray_image)
+        self._boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        self._templates = [self._make_template(gray_image, box) for box in self._boxes]
+        self._frames_since_scan = 0
+        self.full_scans += 1
+        return self._boxes
+
+    def stats(self):
+        return {
+            'full_scans': self.full_scans,
+            'tracked_frames': self.tracked_frames,
+            'low_confidence_rescans': self.low_confidence_rescans,
+        }
+
+    def _track(self, gray_image):
+        """Sigue todas las cajas; devuelve None si alguna cae por debajo de la confianza mínima."""
+        tracked = []
+        for box, template in zip(self._boxes, self._templates):
+            new_box, score = self._track_box(gray_image, box, template)
+            if new_box is None or score < self.min_confidence:
+                return None
+            tracked.append(new_box)
+
+        # Las plantillas se conservan del último escaneo completo: renovarlas en
+        # cada fotograma acumularía el error de posición
+        self._boxes = np.array(tracked, dtype=np.int32).reshape(-1, 4)
+        return self._boxes
+
+    def _track_box(self, gray_image, box, template):
+        x, y, w, h = (int(v) for v in box)
+        image_h, image_w = gray_image.shape[:2]
+        margin_x, margin_y = int(w * self.search_margin), int(h * self.search_margin)
+        x0, y0 = max(0, x - margin_x), max(0, y - margin_y)
+        x1, y1 = min(image_w, x + w + margin_x), min(image_h, y + h + margin_y)
+
+        scale = self._template_scale(w, h)
+        region = gray_image[y0:y1, x0:x1]
+        if scale < 1.0:
+            region = cv2.resize(region, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if region.shape[0] < template.shape[0] or region.shape[1] < template.shape[1]:
+            return None, 0.0
+
+        result = cv2.matchTemplate(region, template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (match_x, match_y) = cv2.minMaxLoc(result)
+        new_x = min(max(0, x0 + round(match_x / scale)), image_w - w)
+        new_y = min(max(0, y0 + round(match_y / scale)), image_h - h)
+        return (new_x, new_y, w, h), score
+
+    def _make_template(self, gray_image, box):
+        x, y, w, h = (int(v) for v in box)
+        template = gray_image[y:y + h, x:x + w]
+        scale = self._template_scale(w, h)
+        if scale < 1.0:
+            template = cv2.resize(template, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        # Copia: la plantilla no debe depender del búfer del fotograma
+        return template.copy()
+
+    @staticmethod
+    def _template_scale(w, h):
+        return min(1.0, TEMPLATE_SIZE / max(w, h))
@@ -0,0 +1,304 @@
+# video.py
+"""
+Procesamiento de video sin interfaz gráfica (archivos MP4/AVI o streams RTSP).
+
+La decodificación corre por delante en un hilo propio y la detección se reparte
+entre varios hilos, tan rápido como permita la CPU. Las detecciones se escriben
+por índice de fotograma y marca de tiempo, en orden, y opcionalmente se genera
+un video anotado. Con -f rec la salida es binaria (records.py): se puede
+consultar por fotograma o por tiempo sin cargarla entera.
+
+Uso:
+    python video.py grabacion.mp4 -c haarcascade_frontalface_default.xml -o detecciones.jsonl
+    python video.py rtsp://127.0.0.1:8554/prueba -c haarcascade_upperbody.xml -f csv -o cuerpos.csv
+    python video.py grabacion.mp4 -c haarcascade_frontalface_default.xml -o detecciones.jsonl --annotate anotado.mp4
+    python video.py grabacion.mp4 -c haarcascade_frontalface_default.xml -o detecciones.jsonl --start-frame 1500
+    python video.py grabacion.mp4 -c haarcascade_frontalface_default.xml -f rec -o detecciones.rec
+"""
+import argparse
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from detector import BOX_COLOR, HAARCASCADE_DIR, ClassifierCache, detect_scaled
+from records import RecordWriter, make_records
+
+READ_AHEAD = 32 # Fotogramas decodificados por adelantado
+OUTPUT_FORMATS = ('jsonl', 'csv', 'rec')
+PROGRESS_INTERVAL = 5.0 # Segundos entre reportes de progreso
+
+
+class FrameReader(threading.Thread):
+    """
+    Hilo de decodificación: lee la fuente y encola (índice, marca de tiempo en ms, fotograma).
+    La cola es bloqueante: aquí no se descarta ningún fotograma. Al terminar encola None.
+    """
+    def __init__(self, source, start_frame=0, queue_size=READ_AHEAD):
+        super().__init__(name="decodificacion", daemon=True)
+        self.source = int(source) if str(source).isdigit() else source
+        self.start_frame = start_frame
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.fps = 0.0
+        self.size = (0, 0)
+        self.error = None
+        self._stop_event = threading.Event()
+        self._opened = threading.Event()
+
+    def open(self):
+        """Arranca el hilo y espera a que la fuente esté abierta. Devuelve si se pudo abrir."""
+        self.start()
+        self._opened.wait()
+        return self.error is None
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        capture = cv2.VideoCapture(self.source)
+        if not capture.isOpened():
+            self.error = f"No se pudo abrir la fuente: {self.source}"
+            self._opened.set()
+            return
+        self.fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+        self.size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self._seek(capture)
+        self._opened.set()
+
+        index = self.start_frame
+        started_at = time.perf_counter()
+        try:
+            while not self._stop_event.is_set():
+                ok, frame = capture.read()
+                if not ok: break
+                timestamp = capture.get(cv2.CAP_PROP_POS_MSEC)
+                if timestamp <= 0 and index > 0:
+                    # Los streams en vivo no siempre informan la posición
+                    timestamp = index * 1000.0 / self.fps if self.fps > 0 else (time.perf_counter() - started_at) * 1000
+                self._put((index, timestamp, frame))
+                index += 1
+        finally:
+            capture.release()
+            self._put(None)
+
+    def _seek(self, capture):
+        """Salta hasta start_frame. Si el contenedor no permite buscar con precisión, lee y descarta."""
+        if not self.start_frame: return
+        if capture.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame) and \
+                int(capture.get(cv2.CAP_PROP_POS_FRAMES)) == self.start_frame:
+            return
+        capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        for _ in range(self.start_frame):
+            if not capture.grab(): break
+
+    def _put(self, item):
+        while not self._stop_event.is_set():
+            try:
+                self.frames.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+
+class DetectionWriter:
+    """
+    Escribe las detecciones por fotograma en JSONL compacto o en CSV (una fila por caja).
+    La cabecera (metadatos en JSONL, nombres de columna en CSV) solo se escribe si se pasan
+    metadatos, es decir, en una salida nueva y no al continuar una anterior.
+    En formato rec, `stream` es un RecordWriter (la cabecera la escribe él).
+    """
+    def __init__(self, stream, fmt='jsonl', metadata=None):
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Formato no soportado: {fmt}")
+        self.stream = stream
+        self.fmt = fmt
+        self._csv = None
+        if fmt == 'rec':
+            pass
+        elif fmt == 'csv':
+            self._csv = csv.writer(stream)
+            if metadata is not None:
+                self._csv.writerow(['frame', 'timestamp_ms', 'x', 'y', 'w', 'h'])
+        elif metadata is not None:
+            stream.write(json.dumps({'meta': metadata}) + '\n')
+
+    def write(self, frame_index, timestamp, boxes):
+        """Solo se escriben los fotogramas con detecciones."""
+        if len(boxes) == 0: return
+        if self.fmt == 'rec':
+            self.stream.append(make_records(frame_index, timestamp / 1000, boxes))
+        elif self.fmt == 'jsonl':
+            record = {'f': frame_index, 't': round(timestamp, 3), 'b': [[int(v) for v in box] for box in boxes]}
+            self.stream.write(json.dumps(record, separators=(',', ':')) + '\n')
+        else:
+            for x, y, w, h in boxes:
+                self._csv.writerow([frame_index, f"{timestamp:.3f}", int(x), int(y), int(w), int(h)])
+
+
+def truncate_output(path, fmt, start_frame):
+    """
+    Reescribe una salida jsonl o csv previa conservando la cabecera y solo los
+    fotogramas anteriores a start_frame. Las líneas que no se pueden interpretar
+    (por ejemplo, la última a medio escribir de una corrida cortada) se descartan.
+    """
+    temp_path = path + '.tmp'
+    with open(path, newline='', encoding='utf-8') as source, \
+            open(temp_path, 'w', newline='', encoding='utf-8') as target:
+        if fmt == 'csv':
+            out = csv.writer(target)
+            for row in csv.reader(source):
+                if row and row[0] == 'frame':
+                    out.writerow(row)
+                    continue
+                try:
+                    if int(row[0]) < start_frame: out.writerow(row)
+                except (IndexError, ValueError):
+                    continue
+        else:
+            for line in source:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if 'meta' in record or record.get('f', start_frame) < start_frame:
+                    target.write(line if line.endswith('\n') else line + '\n')
+    os.replace(temp_path, path)
+
+
+def process_video(source, cascade_name, output=None, fmt='jsonl', annotate=None, start_frame=0,
+                  detection_width=None, workers=None):
+    """
+    Procesa toda la fuente y devuelve las estadísticas de la corrida.
+    Con start_frame > 0 la salida se abre en modo de anexar para continuar una corrida previa,
+    descartando antes lo que esa corrida haya escrito desde start_frame.
+    """
+    if fmt == 'rec' and not output:
+        raise ValueError("El formato rec necesita un archivo de salida (-o)")
+    if annotate and start_frame:
+        # cv2.VideoWriter no puede anexar: el video anotado previo se perdería
+        raise ValueError("--annotate no se puede combinar con --start-frame")
+    cascade_path = os.path.join(HAARCASCADE_DIR, cascade_name)
+    classifiers = ClassifierCache()
+    if not classifiers.load(cascade_path):
+        raise ValueError(f"No se pudo cargar el clasificador: {cascade_name}")
+
+    reader = FrameReader(source, start_frame)
+    if not reader.open():
+        raise ValueError(reader.error)
+
+    def detect(frame):
+        gray_image = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        with classifiers.borrow(cascade_path) as classifier:
+            return detect_scaled(classifier, gray_image, detection_width)
+
+    writer_video = None
+    if annotate:
+        fourcc = cv2.VideoWriter_fourcc(*('mp4v' if annotate.lower().endswith('.mp4') else 'MJPG'))
+        writer_video = cv2.VideoWriter(annotate, fourcc, reader.fps or 30.0, reader.size)
+
+    metadata = {'source': str(source), 'cascade': cascade_name, 'fps': reader.fps,
+                'width': reader.size[0], 'height': reader.size[1], 'start_frame': start_frame}
+    mode = 'a' if start_frame and output and os.path.exists(output) else 'w'
+    # Al continuar se descartan las filas desde start_frame: no quedan fotogramas repetidos
+    if fmt == 'rec':
+        stream = RecordWriter(output, [cascade_name], metadata, append=mode == 'a', start_frame=start_frame)
+    else:
+        if mode == 'a':
+            truncate_output(output, fmt, start_frame)
+        stream = open(output, mode, newline='', encoding='utf-8') if output else sys.stdout
+    workers = workers or os.cpu_count() or 1
+    pending = deque() # Futuros en orden de fotograma
+    frames = detections = 0
+    last_frame = start_frame - 1
+    interrupted = False
+    start = last_report = time.perf_counter()
+
+    def finish_oldest():
+        nonlocal frames, detections, last_frame
+        index, timestamp, frame, future = pending.popleft()
+        boxes = future.result()
+        writer.write(index, timestamp, boxes)
+        if writer_video is not None:
+            for x, y, w, h in boxes:
+                cv2.rectangle(frame, (int(x), int(y)), (int(x + w), int(y + h)), BOX_COLOR, 2)
+            writer_video.write(frame)
+        frames += 1
+        detections += len(boxes)
+        last_frame = index
+
+    try:
+        writer = DetectionWriter(stream, fmt, metadata if mode == 'w' else None)
+        with ThreadPoolExecutor(workers, thread_name_prefix="deteccion") as executor:
+            try:
+                while True:
+                    item = reader.frames.get()
+                    if item is None: break
+                    index, timestamp, frame = item
+                    pending.append((index, timestamp, frame, executor.submit(detect, frame)))
+                    # Ventana acotada de fotogramas en curso; se escriben siempre en orden
+                    while len(pending) > workers * 2 or (pending and pending[0][3].done()):
+                        finish_oldest()
+
+                    now = time.perf_counter()
+                    if now - last_report >= PROGRESS_INTERVAL:
+                        print(f"Fotograma {last_frame}: {frames / (now - start):.1f} fotogramas/s", file=sys.stderr)
+                        last_report = now
+            except KeyboardInterrupt:
+                # Se terminan los fotogramas en curso para que la salida quede continua
+                interrupted = True
+            while pending:
+                finish_oldest()
+    finally:
+        reader.stop()
+        if output: stream.close()
+        if writer_video is not None: writer_video.release()
+
+    elapsed = time.perf_counter() - start
+    return {
+        'frames': frames,
+        'detections': detections,
+        'last_frame': last_frame,
+        'elapsed_s': elapsed,
+        'fps': frames / elapsed if elapsed > 0 else 0.0,
+        'interrupted': interrupted,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detección Haar Cascade sobre archivos de video o streams RTSP.")
+    parser.add_argument('source', help="Archivo de video, URL rtsp:// o índice de cámara")
+    parser.add_argument('-c', '--cascade', required=True, help="Archivo .xml dentro de la carpeta haarcascade")
+    parser.add_argument('-o', '--output', help="Archivo de detecciones (por defecto, la salida estándar)")
+    parser.add_argument('-f', '--format', choices=OUTPUT_FORMATS, default='jsonl', help="Formato de salida")
+    parser.add_argument('--annotate', help="Guardar también un video con las detecciones dibujadas")
+    parser.add_argument('--start-frame', type=int, default=0,
+                        help="Continuar desde este fotograma (se anexa a la salida, descartando lo escrito desde él)")
+    parser.add_argument('--detection-width', type=int, help="Detectar sobre una copia reducida a este ancho")
+    parser.add_argument('-w', '--workers', type=int, help="Hilos de detección (por defecto, uno por núcleo)")
+    args = parser.parse_args(argv)
+
+    try:
+        stats = process_video(args.source, args.cascade, args.output, args.format, args.annotate,
+                              args.start_frame, args.detection_width, args.workers)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Fotogramas: {stats['frames']} (último: {stats['last_frame']}), detecciones: {stats['detections']}",
+          file=sys.stderr)
+    print(f"Tiempo total: {stats['elapsed_s']:.2f} s, {stats['fps']:.1f} fotogramas/s", file=sys.stderr)
+    if stats['interrupted']:
+        print(f"Interrumpido. Para continuar: --start-frame {stats['last_frame'] + 1}", file=sys.stderr)
+        return 130
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,33 @@
 # view.py
-import cv2
-import numpy as np
+import math
+import time
+from collections import deque
+from typing import TYPE_CHECKING
 from PySide6.QtWidgets import (
-    QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QLabel, QComboBox, QMessageBox, QFrame
+    QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout,
+    QPushButton, QLabel, QComboBox, QMessageBox, QFrame, QCheckBox, QSizePolicy
 )
 from PySide6.QtGui import QPixmap, QImage
 from PySide6.QtCore import Qt, Signal
 
+if TYPE_CHECKING:
+    import numpy as np # OpenCV y NumPy se cargan con el primer fotograma, no al abrir la ventana
+
+
+class TimedLabel(QLabel):
+    """QLabel que registra en `metrics` cuánto tarda en pintar su pixmap (etapa 'paint')."""
+    def __init__(self, text="", metrics=None):
+        super().__init__(text)
+        self.metrics = metrics
+
+    def paintEvent(self, event):
+        if self.metrics is None or self.pixmap().isNull():
+            return super().paintEvent(event)
+        start = time.perf_counter()
+        super().paintEvent(event)
+        self.metrics.record('paint', time.perf_counter() - start)
+
+
 class DetectorView(QMainWindow):
     """
     Vista: Define y controla todos los widgets de la interfaz.
@@ -16,14 +36,31 @@ class DetectorView(QMainWindow):
     # Señales que el Controlador escuchará
     analyze_button_clicked = Signal()
     camera_button_clicked = Signal()
+    add_camera_button_clicked = Signal()
     save_button_clicked = Signal()
     classifier_changed = Signal(str)
+    stream_cascade_changed = Signal(int, str) # Cascada elegida en el recuadro de una cámara
+    detection_width_changed = Signal(int) # 0 = resolución completa
+    detect_every_changed = Signal(int) # Escaneo completo cada N fotogramas
+    hierarchy_toggled = Signal(bool) # Buscar ojos/sonrisas dentro de cada detección
+    performance_overlay_toggled = Signal(bool) # Mostrar FPS y latencia por etapa sobre el visor
+    recording_toggled = Signal(bool) # Grabar en disco los fotogramas con detecciones
+    multi_cascade_toggled = Signal(bool) # Rostros de frente y de perfil en una sola pasada
+    motion_gate_toggled = Signal(bool) # Detectar solo donde hay movimiento
+    quality_target_changed = Signal(int) # FPS que sostiene el control adaptativo (0 = calidad fija)
 
-    def __init__(self):
+    def __init__(self, metrics=None):
         super().__init__()
+        self.metrics = metrics # StageMetrics donde se registran la conversión a Qt y el pintado
         self.setWindowTitle("Detector con Haar Cascades (MVC)")
         self.setGeometry(100, 100, 900, 600)
         self.setFixedSize(900, 600)
+        # Ruta de visualización: un búfer reutilizable por etiqueta del tamaño del visor
+        self._display_buffers = {} # id(QLabel) -> arreglo BGR ya escalado
+        self._last_frames = {} # id(QLabel) -> (último arreglo mostrado, número de fotograma)
+        self._render_times = deque(maxlen=120)
+        self.frames_rendered = 0
+        self.frames_skipped = 0
         self._setup_ui()
 
     def _setup_ui(self):
@@ -36,6 +73,17 @@ class DetectorView(QMainWindow):
         self.cascade_combo = QComboBox()
         controls_layout.addWidget(self.cascade_combo)
         
+        controls_layout.addWidget(QLabel("Resolución de detección:"))
+        self.detection_width_combo = QComboBox()
+        self.detection_width_combo.addItem("Completa", 0)
+        for width in (1280, 960, 640, 480):
+            self.detection_width_combo.addItem(f"{width} px de ancho", width)
+        controls_layout.addWidget(self.detection_width_combo)
+        self.hierarchy_check = QCheckBox("Buscar ojos y sonrisas dentro")
+        controls_layout.addWidget(self.hierarchy_check)
+        self.multi_cascade_check = QCheckBox("Rostros de frente y de perfil")
+        controls_layout.addWidget(self.multi_cascade_check)
+
         line1 = QFrame(); line1.setFrameShape(QFrame.HLine)
         controls_layout.addWidget(line1)
 
@@ -59,9 +107,29 @@ class DetectorView(QMainWindow):
         self.camera_button = QPushButton("Iniciar Cámara")
 
         controls_layout.addWidget(QLabel("<b>Modo: Detección en Vivo</b>"))
+        controls_layout.addWidget(QLabel("Escaneo completo:"))
+        self.detect_every_combo = QComboBox()
+        self.detect_every_combo.addItem("En cada fotograma", 1)
+        for frames in (3, 5, 10):
+            self.detect_every_combo.addItem(f"Cada {frames} fotogramas (seguimiento)", frames)
+        controls_layout.addWidget(self.detect_every_combo)
+        self.motion_gate_check = QCheckBox("Detectar solo con movimiento")
+        controls_layout.addWidget(self.motion_gate_check)
+        self.quality_combo = QComboBox()
+        self.quality_combo.addItem("Calidad fija", 0)
+        for fps in (10, 15, 25):
+            self.quality_combo.addItem(f"Calidad adaptativa ({fps} FPS)", fps)
+        controls_layout.addWidget(self.quality_combo)
         self.camera_button = QPushButton("Iniciar Cámara")
         self.camera_button.setStyleSheet("background-color: #007BFF; color: white; padding: 10px;")
         controls_layout.addWidget(self.camera_button)
+        self.add_camera_button = QPushButton("Agregar Cámara")
+        self.add_camera_button.setEnabled(False)
+        controls_layout.addWidget(self.add_camera_button)
+        self.recording_check = QCheckBox("Grabar detecciones")
+        controls_layout.addWidget(self.recording_check)
+        self.performance_check = QCheckBox("Mostrar rendimiento")
+        controls_layout.addWidget(self.performance_check)
         controls_layout.addStretch()
         
         controls_widget = QWidget()
@@ -69,14 +137,29 @@ class DetectorView(QMainWindow):
         controls_widget.setFixedWidth(250)
 
         # --- Visor de Imagen (Derecha) ---
-        self.image_label = QLabel("Seleccione un modo de operación")
+        self.image_label = TimedLabel("Seleccione un modo de operación", self.metrics)
         self.image_label.setAlignment(Qt.AlignCenter)
         self.image_label.setStyleSheet("background-color: #f0f0f0; border: 1px solid #ccc;")
 
+        # Cuadrícula de cámaras: un recuadro por stream; sin streams se ve image_label
+        self.stream_tiles = {} # índice de cámara -> (QLabel de imagen, QLabel de estado, selector de cascada, pie)
+        self.cascades = []
+        self.display_grid = QGridLayout()
+        self.display_grid.setContentsMargins(0, 0, 0, 0)
+        self.display_grid.addWidget(self.image_label, 0, 0)
+        display_widget = QWidget()
+        display_widget.setLayout(self.display_grid)
+        # Superposición de rendimiento: flota sobre el visor, fuera de la cuadrícula
+        self.performance_overlay = QLabel(display_widget)
+        self.performance_overlay.setStyleSheet(
+            "background-color: rgba(0, 0, 0, 160); color: white; font-family: monospace; padding: 6px;")
+        self.performance_overlay.move(8, 8)
+        self.performance_overlay.hide()
+
         # --- Layout Principal ---
         main_layout = QHBoxLayout()
         main_layout.addWidget(controls_widget)
-        main_layout.addWidget(self.image_label)
+        main_layout.addWidget(display_widget)
         central_widget = QWidget()
         central_widget.setLayout(main_layout)
         self.setCentralWidget(central_widget)
@@ -84,32 +167,179 @@ class DetectorView(QMainWindow):
         # Conectar señales internas de widgets a las señales de la clase
         self.analyze_button.clicked.connect(self.analyze_button_clicked.emit)
         self.camera_button.clicked.connect(self.camera_button_clicked.emit)
+        self.add_camera_button.clicked.connect(self.add_camera_button_clicked.emit)
         self.save_button.clicked.connect(self.save_button_clicked.emit)
         self.cascade_combo.currentTextChanged.connect(self.classifier_changed.emit)
+        self.detection_width_combo.currentIndexChanged.connect(
+            lambda: self.detection_width_changed.emit(self.detection_width_combo.currentData()))
+        self.hierarchy_check.toggled.connect(self.hierarchy_toggled.emit)
+        self.multi_cascade_check.toggled.connect(self.multi_cascade_toggled.emit)
+        self.motion_gate_check.toggled.connect(self.motion_gate_toggled.emit)
+        self.performance_check.toggled.connect(self.performance_overlay_toggled.emit)
+        self.recording_check.toggled.connect(self.recording_toggled.emit)
+        self.detect_every_combo.currentIndexChanged.connect(
+            lambda: self.detect_every_changed.emit(self.detect_every_combo.currentData()))
+        self.quality_combo.currentIndexChanged.connect(
+            lambda: self.quality_target_changed.emit(self.quality_combo.currentData()))
 
     # --- Métodos que el Controlador puede llamar para actualizar la UI ---
     def populate_combos(self, cascades, images, cameras): # Añadir 'cameras'
+        self.cascades = list(cascades) # También para el selector de cada recuadro de cámara
         self.cascade_combo.addItems(cascades)
         self.image_combo.addItems(images)
         
+        self.set_cameras(cameras)
+
+    def set_cameras(self, cameras, searching=False):
+        """Reemplaza la lista de cámaras conservando la selección si sigue disponible."""
+        selected = self.camera_combo.currentData()
+        self.camera_combo.clear()
         # Poblar el nuevo menú de cámaras
         if not cameras:
-            self.camera_combo.addItem("No se encontraron cámaras")
+            self.camera_combo.addItem("Buscando cámaras..." if searching else "No se encontraron cámaras")
             self.camera_combo.setEnabled(False)
             self.camera_button.setEnabled(False)
-        else:
-            for index in cameras:
-                # Guardamos el índice numérico como dato asociado al texto
-                self.camera_combo.addItem(f"Cámara {index}", index)
+            return
+
+        self.camera_combo.setEnabled(True)
+        self.camera_button.setEnabled(True)
+        for index in sorted(cameras):
+            # Guardamos el índice numérico como dato asociado al texto
+            self.camera_combo.addItem(f"Cámara {index}", index)
+        if selected is not None and selected in cameras:
+            self.camera_combo.setCurrentIndex(self.camera_combo.findData(selected))
+
+    def add_camera_option(self, index):
+        """Agrega una cámara recién encontrada al menú, si no estaba ya."""
+        if self.camera_combo.findData(index) >= 0: return
+        cameras = [self.camera_combo.itemData(i) for i in range(self.camera_combo.count())]
+        self.set_cameras([i for i in cameras if i is not None] + [index])
+
+    def display_image(self, cv_image: 'np.ndarray'):
+        self._show_frame(self.image_label, cv_image)
+
+    def display_stream_image(self, stream_id: int, cv_image: 'np.ndarray', sequence: int = 0):
+        tile = self.stream_tiles.get(stream_id)
+        if tile is not None:
+            self._show_frame(tile[0], cv_image, sequence)
+
+    def _show_frame(self, label: QLabel, cv_image: 'np.ndarray', sequence: int = 0):
+        """
+        Muestra un fotograma BGR en la etiqueta sin pasar por una copia RGB:
+        se escala una sola vez al tamaño del visor sobre un búfer reutilizable
+        y Qt lo lee directamente como BGR888. Las cámaras reutilizan sus búferes,
+        así que el mismo arreglo puede traer otro fotograma: `sequence` los distingue.
+        """
+        import cv2 # Ya cargado por el modelo cuando llega un fotograma: la importación no cuesta
+        import numpy as np
+        key = id(label)
+        # Sin repintados inútiles: widget oculto o el mismo fotograma de antes
+        last_image, last_sequence = self._last_frames.get(key, (None, 0))
+        if not label.isVisible() or self.isMinimized() or (last_image is cv_image and last_sequence == sequence):
+            self.frames_skipped += 1
+            return
+
+        start = time.perf_counter()
+        height, width = cv_image.shape[:2]
+        scale = min(label.width() / width, label.height() / height)
+        target_w, target_h = max(1, int(width * scale)), max(1, int(height * scale))
+
+        buffer = self._display_buffers.get(key)
+        if buffer is None or buffer.shape[:2] != (target_h, target_w):
+            buffer = self._display_buffers[key] = np.empty((target_h, target_w, 3), dtype=np.uint8)
+        # Bilineal: de calidad similar a SmoothTransformation y mucho más barata que INTER_AREA
+        cv2.resize(cv_image, (target_w, target_h), dst=buffer, interpolation=cv2.INTER_LINEAR)
+
+        # QPixmap.fromImage copia los píxeles, así que el búfer se puede reutilizar en el siguiente fotograma
+        q_image = QImage(buffer.data, target_w, target_h, buffer.strides[0], QImage.Format_BGR888)
+        label.setPixmap(QPixmap.fromImage(q_image))
+        self._last_frames[key] = (cv_image, sequence)
+
+        elapsed = time.perf_counter() - start
+        self._render_times.append(elapsed)
+        if self.metrics is not None:
+            self.metrics.record('convert', elapsed)
+        self.frames_rendered += 1
+
+    def render_stats(self):
+        """Costo de mostrar cada fotograma (promedio y máximo recientes, en ms) y repintados evitados."""
+        times = list(self._render_times)
+        return {
+            'frames': self.frames_rendered,
+            'skipped': self.frames_skipped,
+            'avg_ms': sum(times) / len(times) * 1000 if times else 0.0,
+            'max_ms': max(times) * 1000 if times else 0.0,
+        }
+
+    def set_metrics(self, metrics):
+        """Asigna el StageMetrics (cuando el modelo se crea después de mostrar la ventana)."""
+        self.metrics = metrics
+        for label in [self.image_label] + [tile[0] for tile in self.stream_tiles.values()]:
+            label.metrics = metrics
+
+    def set_stream_tiles(self, stream_ids, cascades=None):
+        """
+        Reorganiza el visor en una cuadrícula con un recuadro por cámara activa.
+        Cada recuadro tiene su selector de cascada; `cascades` da la actual de cada cámara.
+        """
+        cascades = cascades or {}
+        for image_label, _, _, footer in self.stream_tiles.values():
+            self._display_buffers.pop(id(image_label), None)
+            self._last_frames.pop(id(image_label), None)
+            for widget in (image_label, footer):
+                self.display_grid.removeWidget(widget)
+                widget.deleteLater()
+        self.stream_tiles = {}
+        self.image_label.setVisible(not stream_ids)
+
+        columns = math.ceil(math.sqrt(len(stream_ids))) if stream_ids else 1
+        for i, stream_id in enumerate(stream_ids):
+            image_label = TimedLabel(f"Cámara {stream_id}", self.metrics)
+            image_label.setAlignment(Qt.AlignCenter)
+            image_label.setStyleSheet("background-color: #f0f0f0; border: 1px solid #ccc;")
+            # Ignored: el recuadro no crece con el pixmap, lo reparte la cuadrícula
+            image_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+            caption_label = QLabel(f"Cámara {stream_id}")
+            cascade_combo = QComboBox()
+            cascade_combo.addItems(self.cascades)
+            cascade_combo.setCurrentText(cascades.get(stream_id, self.cascade_combo.currentText()))
+            cascade_combo.currentTextChanged.connect(
+                lambda name, stream_id=stream_id: self.stream_cascade_changed.emit(stream_id, name))
+            footer = QWidget()
+            footer_layout = QHBoxLayout(footer)
+            footer_layout.setContentsMargins(0, 0, 0, 0)
+            footer_layout.addWidget(cascade_combo)
+            footer_layout.addWidget(caption_label, 1)
+            row, column = (i // columns) * 2, i % columns
+            self.display_grid.addWidget(image_label, row, column)
+            self.display_grid.addWidget(footer, row + 1, column)
+            self.stream_tiles[stream_id] = (image_label, caption_label, cascade_combo, footer)
+        self.performance_overlay.raise_()
+
+    def set_stream_cascade(self, stream_id: int, cascade_name: str):
+        """Muestra en el recuadro la cascada de la cámara sin volver a emitir el cambio."""
+        tile = self.stream_tiles.get(stream_id)
+        if tile is not None:
+            tile[2].blockSignals(True)
+            tile[2].setCurrentText(cascade_name)
+            tile[2].blockSignals(False)
+
+    def set_stream_caption(self, stream_id: int, text: str):
+        tile = self.stream_tiles.get(stream_id)
+        if tile is not None:
+            tile[1].setText(text)
+
+    def set_performance_overlay(self, text: str):
+        self.performance_overlay.setText(text)
+        self.performance_overlay.adjustSize()
 
-    def display_image(self, cv_image: np.ndarray):
-        height, width, channel = cv_image.shape
-        bytes_per_line = 3 * width
-        q_image = QImage(cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB).data, width, height, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(q_image)
-        self.image_label.setPixmap(pixmap.scaled(self.image_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+    def set_performance_overlay_visible(self, visible: bool):
+        self.performance_overlay.setVisible(visible)
+        if visible:
+            self.performance_overlay.raise_()
 
     def set_camera_button_state(self, is_active: bool):
+        self.add_camera_button.setEnabled(is_active)
         if is_active:
             self.camera_button.setText("Detener Cámara")
             self.camera_button.setStyleSheet("background-color: #DC3545; color: white; padding: 10px;")